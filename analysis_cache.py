@@ -0,0 +1,105 @@
+# Shared on-disk cache of model analyses, so identical requests skip the API call
+
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from text_cache import cache_root, evict_lru, write_atomic
+
+DEFAULT_ANALYSIS_CACHE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_ANALYSIS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _normalize_text(text):
+    """Collapse whitespace differences that do not change the meaning of a prompt part."""
+    lines = (re.sub(r"\s+", " ", line).strip() for line in text.replace("\r\n", "\n").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def lesson_content_hash(lesson_text):
+    """Hash of one lesson's extracted text, used as part of the analysis cache key."""
+    return hashlib.sha256(lesson_text.encode("utf-8")).hexdigest()
+
+
+def analysis_cache_key(instructions, standards, lesson_hashes, model_name, generation_config, mode="single"):
+    """Build the cache key for an analysis request.
+
+    lesson_hashes must be in selection order, since the order of lessons in the
+    prompt can change the model's answer. mode distinguishes analysis strategies
+    (single request, map-reduce, ...) that produce different answers.
+    """
+    payload = json.dumps({
+        "instructions": _normalize_text(instructions),
+        "standards": _normalize_text(standards),
+        "lessons": list(lesson_hashes),
+        "model": model_name,
+        "generation_config": generation_config,
+        "mode": mode,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Analyses stored as JSON files with a time-to-live and a total size cap.
+
+    Expired entries are dropped on read and during eviction; when the cache is
+    over max_bytes, the least recently used entries go first.
+    """
+
+    def __init__(self, root=None, ttl_seconds=None, max_bytes=None):
+        if root is None:
+            root = cache_root() / "analysis"
+        if ttl_seconds is None:
+            ttl_seconds = int(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", DEFAULT_ANALYSIS_CACHE_TTL_SECONDS))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", DEFAULT_ANALYSIS_CACHE_MAX_BYTES))
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, key):
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached entry ({"analysis", "created_at", ...}) or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, analysis, **metadata):
+        """Store an analysis with optional metadata (model name, lesson names, ...)."""
+        entry = dict(metadata, analysis=analysis, created_at=time.time())
+        write_atomic(self._entry_path(key), json.dumps(entry).encode("utf-8"))
+        self._evict()
+
+    def _evict(self):
+        """Remove expired entries, then least recently used ones until under max_bytes."""
+        now = time.time()
+        remaining = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                # mtime is the last use, which is never earlier than created_at
+                if now - path.stat().st_mtime > self.ttl_seconds:
+                    path.unlink()
+                else:
+                    remaining.append(path)
+            except FileNotFoundError:
+                continue
+        evict_lru(remaining, self.max_bytes)
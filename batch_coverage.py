@@ -0,0 +1,282 @@
+# Headless coverage analysis for many (lesson set, standards) jobs, with checkpoint/resume
+#
+#   python batch_coverage.py manifest.json --out coverage.json
+#
+# The manifest lists jobs explicitly, or a matrix whose lesson sets are each
+# analyzed against each standard:
+#
+#   {"jobs": [{"id": "g6-u1", "lessons": ["6.01"], "standards": ["MA.6.NSO.1.1", "MA.6.NSO.1.2"]}],
+#    "matrix": {"lessons": ["6.01", "6.02"], "standards": ["MA.6.NSO.1.1", "MA.6.AR"]}}
+#
+# A lesson set entry is a grade ("6"), a unit ("6.01") or a lesson ("6.01.05").
+# A standards entry is a MATH_STANDARDS ID or a prefix of one ("MA.6.AR").
+# Every finished job is appended to <out>.checkpoint.jsonl; rerunning the same
+# command skips jobs already done and retries failed ones. A job whose lessons
+# or standards match nothing is reported as failed without being run.
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from analysis_cache import AnalysisCache
+from lesson_analysis import DEFAULT_INSTRUCTIONS, INSTRUCTIONS_PATH, analyze_async, assemble_lessons, plan_analysis
+from lesson_boilerplate import get_boilerplate
+from lesson_catalog import LESSONS_DIR, get_lesson_catalog
+from lesson_extraction import clean_page, iter_lesson_pages
+from model_client import get_client
+from model_providers import provider_model_name, requires_api_key
+from standards_index import STANDARDS_INDEX
+from text_cache import file_digest
+
+# Most jobs analyzed at once
+DEFAULT_BATCH_CONCURRENCY = 2
+
+
+def resolve_lesson_set(catalog, entry):
+    """Return the catalog records named by "6", "6.01" or "6.01.05"."""
+    numbers = [int(part) for part in str(entry).split(".")]
+    grade = f"Grade {numbers[0]}"
+    if len(numbers) == 1:
+        records = catalog.lessons_in_grade(grade)
+    elif len(numbers) == 2:
+        records = catalog.lessons_in_unit(grade, f"Unit {numbers[1]}")
+    elif len(numbers) == 3:
+        record = catalog.lesson(grade, f"Unit {numbers[1]}", numbers[2])
+        records = (record,) if record else ()
+    else:
+        records = ()
+    if not records:
+        raise ValueError(f"No lessons match {entry!r}")
+    return records
+
+
+def resolve_standards(references):
+    """Return the MATH_STANDARDS IDs named by IDs or prefixes, in order and without duplicates."""
+    standard_ids = {}
+    for reference in references:
+        matches = STANDARDS_INDEX.lookup(reference)
+        if not matches:
+            raise ValueError(f"Unknown standard {reference!r}")
+        standard_ids.update(dict.fromkeys(matches))
+    return list(standard_ids)
+
+
+def load_manifest(manifest_path, catalog):
+    """Expand a manifest into jobs: dicts with id, lesson paths, standard IDs, a fingerprint and an error.
+
+    error is None, or why the job's lesson or standards entries could not be resolved.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    specs = list(manifest.get("jobs", []))
+    matrix = manifest.get("matrix")
+    if matrix:
+        for lesson_entry in matrix["lessons"]:
+            for standard in matrix["standards"]:
+                specs.append({"lessons": [lesson_entry], "standards": [standard]})
+
+    jobs = []
+    seen_ids = set()
+    for spec in specs:
+        job_id = spec.get("id") or f"{'+'.join(map(str, spec['lessons']))} x {'+'.join(spec['standards'])}"
+        if job_id in seen_ids:
+            raise ValueError(f"Duplicate job id {job_id!r}")
+        seen_ids.add(job_id)
+        try:
+            records = {}
+            for entry in spec["lessons"]:
+                for record in resolve_lesson_set(catalog, entry):
+                    records[record.path] = record
+            standard_ids = resolve_standards(spec["standards"])
+        except ValueError as e:
+            jobs.append({"id": job_id, "lesson_paths": [], "standard_ids": [], "fingerprint": None, "error": str(e)})
+            continue
+        lesson_paths = [record.path for record in sorted(records.values(), key=lambda record: record.index)]
+        # Changes to a job's lessons (names or contents) or standards make its checkpoint stale
+        fingerprint = hashlib.sha256(json.dumps([
+            [[Path(path).name, file_digest(path)] for path in lesson_paths], standard_ids,
+        ]).encode("utf-8")).hexdigest()
+        jobs.append({
+            "id": job_id,
+            "lesson_paths": lesson_paths,
+            "standard_ids": standard_ids,
+            "fingerprint": fingerprint,
+            "error": None,
+        })
+    return jobs
+
+
+def load_checkpoint(checkpoint_path):
+    """Return finished results by job id from a checkpoint file (later lines win).
+
+    A last line cut short by an interrupted run is dropped from the file so
+    new results are appended after the last complete one.
+    """
+    results = {}
+    if not checkpoint_path.exists():
+        return results
+    data = checkpoint_path.read_bytes()
+    complete_length = data.rfind(b"\n") + 1
+    if complete_length < len(data):
+        with open(checkpoint_path, "r+b") as f:
+            f.truncate(complete_length)
+    for line in data[:complete_length].decode("utf-8").splitlines():
+        result = json.loads(line)
+        results[result["id"]] = result
+    return results
+
+
+def append_checkpoint(checkpoint_path, result):
+    """Append one finished result and flush it to disk before moving on."""
+    with open(checkpoint_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+async def run_job(job, client, instructions, extraction_errors, analysis_cache, force_refresh):
+    """Analyze one job; failures are returned as results rather than raised."""
+    result = {
+        "id": job["id"],
+        "fingerprint": job["fingerprint"],
+        "lessons": [Path(path).name for path in job["lesson_paths"]],
+        "standards": job["standard_ids"],
+        "model": client.model_name,
+    }
+    start_time = time.perf_counter()
+    try:
+        for path in job["lesson_paths"]:
+            if path in extraction_errors:
+                raise ValueError(f"Could not read {Path(path).name}: {extraction_errors[path]}")
+        # Pages come from the text cache warmed in run_batch; only this job's lessons are held
+        boilerplate = get_boilerplate()
+        stripper = boilerplate.stripper() if boilerplate else None
+        with contextlib.closing(iter_lesson_pages(job["lesson_paths"])) as page_stream:
+            page_records = stripper.strip(page_stream) if stripper else page_stream
+            assembled = assemble_lessons(page_records, clean=clean_page)
+        if stripper:
+            result["boilerplate_tokens_saved"] = stripper.tokens_saved
+        lessons = assembled.lessons
+        standards = "".join(STANDARDS_INDEX.formatted[standard_id] for standard_id in job["standard_ids"])
+        plan = plan_analysis(instructions, standards, lessons, client.model_name, assembled.hashes)
+        cached = None if force_refresh else analysis_cache.get(plan.cache_key)
+        if cached:
+            analysis = cached["analysis"]
+        else:
+            analysis = await analyze_async(client, instructions, standards, lessons, plan)
+            if analysis:
+                analysis_cache.put(plan.cache_key, analysis, model=client.model_name, mode=plan.mode,
+                                   standards=job["standard_ids"])
+        result.update(status="ok", mode=plan.mode, cached=bool(cached), analysis=analysis)
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+
+async def run_jobs(jobs, client, instructions, extraction_errors, analysis_cache, checkpoint_path,
+                   concurrency, force_refresh, log):
+    """Run jobs at most `concurrency` at a time, checkpointing each as it finishes."""
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = 0
+
+    async def run(job):
+        nonlocal finished
+        async with semaphore:
+            result = await run_job(job, client, instructions, extraction_errors, analysis_cache, force_refresh)
+        append_checkpoint(checkpoint_path, result)
+        finished += 1
+        status = result["status"] if result["status"] == "ok" else f"FAILED: {result['error']}"
+        log(f"[{finished}/{len(jobs)}] {job['id']} {status}")
+        return result
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+def run_batch(manifest_path, out_path, concurrency=None, force_refresh=False, lessons_dir=LESSONS_DIR, log=print):
+    """Run every job in a manifest, resuming from <out>.checkpoint.jsonl, and write the results file.
+
+    Returns the number of failed jobs.
+    """
+    out_path = Path(out_path)
+    checkpoint_path = out_path.with_name(out_path.name + ".checkpoint.jsonl")
+    concurrency = concurrency or int(os.environ.get("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+
+    jobs = load_manifest(manifest_path, get_lesson_catalog(lessons_dir))
+    done = {
+        job_id: result for job_id, result in load_checkpoint(checkpoint_path).items()
+        if result["status"] == "ok"
+    }
+    invalid = [job for job in jobs if job["error"]]
+    for job in invalid:
+        done[job["id"]] = {"id": job["id"], "fingerprint": None, "status": "error", "error": job["error"]}
+        log(f"{job['id']} FAILED: {job['error']}")
+    todo = [
+        job for job in jobs
+        if not job["error"]
+        and (force_refresh or done.get(job["id"], {}).get("fingerprint") != job["fingerprint"])
+    ]
+    log(f"{len(jobs)} jobs, {len(jobs) - len(todo) - len(invalid)} already done, {len(invalid)} invalid, "
+        f"running {len(todo)}")
+
+    if todo:
+        if INSTRUCTIONS_PATH.exists():
+            instructions = INSTRUCTIONS_PATH.read_text(encoding="utf-8")
+        else:
+            instructions = DEFAULT_INSTRUCTIONS
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if requires_api_key() and not api_key:
+            raise RuntimeError("GOOGLE_API_KEY is not set")
+        client = get_client(api_key)
+
+        # Every lesson is parsed once into the text cache, however many jobs use it;
+        # each lesson's pages are dropped once read, so the corpus is never held in memory
+        lesson_paths = list(dict.fromkeys(path for job in todo for path in job["lesson_paths"]))
+        extraction_errors = {}
+        for _ in iter_lesson_pages(lesson_paths, on_error=extraction_errors.__setitem__):
+            pass
+        for result in asyncio.run(run_jobs(
+            todo, client, instructions, extraction_errors, AnalysisCache(), checkpoint_path,
+            concurrency, force_refresh, log,
+        )):
+            done[result["id"]] = result
+
+    results = [done.get(job["id"]) for job in jobs]
+    failed = sum(1 for result in results if result is None or result["status"] != "ok")
+    output = {
+        "manifest": str(manifest_path),
+        "model": provider_model_name(),
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "jobs": len(jobs),
+        "failed": failed,
+        "results": [result for result in results if result is not None],
+    }
+    out_path.write_text(json.dumps(output, indent=2), encoding="utf-8")
+    log(f"Wrote {out_path} ({len(jobs) - failed} ok, {failed} failed)")
+    return failed
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run coverage analyses for a manifest of lesson sets and standards.")
+    parser.add_argument("manifest", help="JSON manifest of jobs")
+    parser.add_argument("--out", default="coverage_results.json", help="results file (default: coverage_results.json)")
+    parser.add_argument("--concurrency", type=int,
+                        help=f"jobs analyzed at once (default: BATCH_CONCURRENCY or {DEFAULT_BATCH_CONCURRENCY})")
+    parser.add_argument("--force", action="store_true", help="rerun every job, ignoring checkpoint and analysis cache")
+    args = parser.parse_args(argv)
+    failed = run_batch(args.manifest, args.out, args.concurrency, args.force)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
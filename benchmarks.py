@@ -0,0 +1,305 @@
+# Benchmarks of the app's hot paths on the lessons/ corpus, saved as JSON for comparing runs
+#
+#   python benchmarks.py                          # sample of 20 lessons, writes .cache/benchmarks/<time>.json
+#   python benchmarks.py --limit 0 --out run.json # every lesson
+#   python benchmarks.py --compare baseline.json  # exit 1 if any benchmark regressed
+#   python benchmarks.py --memory-unit 6.02       # also peak memory of analyzing a whole unit
+#
+# Streamlit wrappers cannot be imported outside a script run, so each benchmark
+# times the function the app's code delegates to: lesson text -> backend
+# extraction / text cache, reprocess_pdf -> ensure_processed_pdf,
+# display_pdf -> base64 of the processed PDF.
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from extraction_backends import get_backend
+from lesson_analysis import DEFAULT_INSTRUCTIONS, INSTRUCTIONS_PATH, assemble_lessons, plan_analysis
+from lesson_catalog import (
+    LESSONS_DIR, directory_signature, get_lesson_catalog, get_lessons_by_grade_and_unit, scan_lessons,
+)
+from lesson_extraction import clean_page, extract_lessons_parallel, extractor_version, iter_lesson_pages, join_pages
+from processed_pdfs import ensure_processed_pdf
+from standards_index import STANDARDS_INDEX, _resolve_cached
+from text_cache import TextCache, cache_root, file_digest
+
+DEFAULT_SAMPLE_SIZE = 20
+DEFAULT_REPEAT = 5
+# A benchmark regresses when its median grows by more than this fraction...
+DEFAULT_REGRESSION_THRESHOLD = 0.15
+# ...and by more than this many seconds (ignores noise in sub-millisecond timings)
+REGRESSION_MIN_SECONDS = 0.002
+
+# Standards input used for prompt assembly: a full ID and a domain prefix
+BENCHMARK_STANDARDS = "MA.6.NSO.1.1\nMA.7.AR.2"
+
+
+def sample_lessons(lessons_dir, limit):
+    """Evenly spaced lessons across the sorted corpus (all of them when limit is 0)."""
+    paths = sorted(str(path) for path in Path(lessons_dir).glob("*.pdf"))
+    if not limit or limit >= len(paths):
+        return paths
+    step = len(paths) / limit
+    return [paths[int(i * step)] for i in range(limit)]
+
+
+def summarize(seconds, total_bytes=None):
+    """Timing statistics for a list of per-run (or per-lesson) durations."""
+    ordered = sorted(seconds)
+    result = {
+        "runs": len(ordered),
+        "median_seconds": statistics.median(ordered),
+        "p95_seconds": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min_seconds": ordered[0],
+        "total_seconds": sum(ordered),
+    }
+    if total_bytes:
+        result["megabytes"] = total_bytes / 1e6
+        result["seconds_per_mb"] = sum(ordered) / (total_bytes / 1e6)
+    return result
+
+
+def time_calls(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def time_each(function, items):
+    """Time function(item) once per item; returns (durations, results)."""
+    durations, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(function(item))
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+def run_benchmarks(lessons_dir, lesson_paths, repeat, log=print):
+    """Run every benchmark; returns {name: statistics}."""
+    results = {}
+    total_bytes = sum(os.path.getsize(path) for path in lesson_paths)
+
+    def record(name, stats):
+        results[name] = stats
+        log(f"{name:<28}{stats['median_seconds'] * 1000:>12.3f} ms median"
+            + (f"{stats['seconds_per_mb']:>12.4f} s/MB" if "seconds_per_mb" in stats else ""))
+
+    record("catalog_scan", summarize(time_calls(
+        lambda: scan_lessons(lessons_dir, directory_signature(lessons_dir)), repeat)))
+    get_lessons_by_grade_and_unit(lessons_dir)
+    record("catalog_cached", summarize(time_calls(
+        lambda: get_lessons_by_grade_and_unit(lessons_dir), repeat * 20)))
+
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+
+        # extract_text_from_pdf on a cache miss: parse with the configured backend
+        def extract(path):
+            backend = get_backend(path)
+            return backend, backend.extract_pages(path)
+
+        durations, extracted = time_each(extract, lesson_paths)
+        record("extract_uncached", summarize(durations, total_bytes))
+
+        # ...and on a text cache hit
+        text_cache = TextCache(root=scratch / "text")
+        for path, (backend, pages) in zip(lesson_paths, extracted):
+            text_cache.put(file_digest(path), extractor_version(backend), "\f".join(pages))
+        durations, _ = time_each(
+            lambda item: join_pages(text_cache.get(file_digest(item[0]), extractor_version(item[1][0])).split("\f")),
+            list(zip(lesson_paths, extracted)),
+        )
+        record("extract_cached", summarize(durations, total_bytes))
+
+        # Prompt assembly for the whole sample as one selection
+        instructions = (
+            INSTRUCTIONS_PATH.read_text(encoding="utf-8") if INSTRUCTIONS_PATH.exists() else DEFAULT_INSTRUCTIONS
+        )
+        lessons = [(Path(path).name, join_pages(pages)) for path, (_, pages) in zip(lesson_paths, extracted)]
+
+        def assemble_prompt():
+            _resolve_cached.cache_clear()
+            standards, _ = STANDARDS_INDEX.resolve(BENCHMARK_STANDARDS)
+            return plan_analysis(instructions, standards, lessons)
+
+        record("prompt_assembly", summarize(time_calls(assemble_prompt, repeat)))
+        del extracted, lessons
+
+        # reprocess_pdf: first render, then the cached copy
+        processed_root = scratch / "processed"
+        durations, processed = time_each(lambda path: ensure_processed_pdf(path, processed_root), lesson_paths)
+        record("reprocess_uncached", summarize(durations, total_bytes))
+        durations, _ = time_each(lambda path: ensure_processed_pdf(path, processed_root), lesson_paths)
+        record("reprocess_cached", summarize(durations, total_bytes))
+
+        # display_pdf's inline fallback: base64 of the processed PDF
+        processed_bytes = sum(path.stat().st_size for path in processed)
+        durations, _ = time_each(lambda path: base64.b64encode(path.read_bytes()).decode("utf-8"), processed)
+        record("display_pdf_base64", summarize(durations, processed_bytes))
+
+    return results
+
+
+def _peak_rss_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _unit_memory(pipeline, lesson_paths):
+    """Run one extraction-to-prompt pipeline in this (fresh) process and report its memory peaks.
+
+    "lists" is the original flow: every lesson's page list, then the joined
+    texts, then the prompt. "records" reads lessons one at a time through
+    iter_lesson_pages and assembles cleaned, hashed texts for the prompt; it
+    holds about as much text as "lists" and adds the cleaning and hashing.
+    """
+    instructions = (
+        INSTRUCTIONS_PATH.read_text(encoding="utf-8") if INSTRUCTIONS_PATH.exists() else DEFAULT_INSTRUCTIONS
+    )
+    standards, _ = STANDARDS_INDEX.resolve(BENCHMARK_STANDARDS)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if pipeline == "lists":
+        results = extract_lessons_parallel(lesson_paths)
+        lessons = [(Path(result.path).name, join_pages(result.pages)) for result in results if result.pages]
+        plan = plan_analysis(instructions, standards, lessons)
+    else:
+        assembled = assemble_lessons(iter_lesson_pages(lesson_paths), clean=clean_page)
+        plan = plan_analysis(instructions, standards, assembled.lessons, lesson_hashes=assembled.hashes)
+    seconds = time.perf_counter() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "prompt_chars": len(plan.prompt),
+        "python_peak_mb": python_peak / (1024 * 1024),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def measure_unit_memory(lessons_dir, unit, log=print):
+    """Peak memory of building the prompt for a whole unit ("6.02"), per pipeline.
+
+    Each pipeline runs in a new process so peak RSS belongs to that run alone.
+    The unit's lessons are extracted once beforehand, so both pipelines read
+    warm caches.
+    """
+    grade_number, unit_number = (int(part) for part in unit.split("."))
+    records = get_lesson_catalog(lessons_dir).lessons_in_unit(f"Grade {grade_number}", f"Unit {unit_number}")
+    if not records:
+        raise ValueError(f"No lessons in unit {unit}")
+    lesson_paths = [record.path for record in records]
+    extract_lessons_parallel(lesson_paths)
+    results = {"unit": unit, "lessons": len(lesson_paths)}
+    for pipeline in ("lists", "records"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[pipeline] = stats = pool.submit(_unit_memory, pipeline, lesson_paths).result()
+        log(f"unit {unit} {pipeline:<10}{stats['peak_rss_mb']:>10.1f} MB peak RSS"
+            f"{stats['python_peak_mb']:>10.1f} MB Python peak{stats['seconds']:>10.3f} s")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_runs(baseline, current, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """Compare median timings of two runs; returns (rows, regressed benchmark names)."""
+    rows, regressed = [], []
+    for name, stats in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        old, new = before["median_seconds"], stats["median_seconds"]
+        change = (new - old) / old if old else 0.0
+        is_regression = change > threshold and new - old > REGRESSION_MIN_SECONDS
+        rows.append((name, old, new, change, is_regression))
+        if is_regression:
+            regressed.append(name)
+    return rows, regressed
+
+
+def _print_comparison(rows):
+    print(f"{'benchmark':<28}{'before ms':>12}{'after ms':>12}{'change':>10}")
+    for name, old, new, change, is_regression in rows:
+        flag = "  REGRESSION" if is_regression else ""
+        print(f"{name:<28}{old * 1000:>12.3f}{new * 1000:>12.3f}{change:>+10.1%}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction, catalog, prompt and PDF display paths.")
+    parser.add_argument("--lessons", default=str(LESSONS_DIR), help="directory of lesson PDFs (default: lessons/)")
+    parser.add_argument("--limit", type=int, default=DEFAULT_SAMPLE_SIZE,
+                        help=f"lessons to sample, 0 for all (default: {DEFAULT_SAMPLE_SIZE})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs of whole-call benchmarks")
+    parser.add_argument("--out", help="results file (default: .cache/benchmarks/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="median slowdown treated as a regression (default: 0.15 = 15%%)")
+    parser.add_argument("--memory-unit", metavar="GRADE.UNIT",
+                        help="also measure peak memory of building the prompt for a whole unit, e.g. 6.02")
+    args = parser.parse_args(argv)
+
+    lesson_paths = sample_lessons(args.lessons, args.limit)
+    if not lesson_paths:
+        print(f"No PDFs found in {args.lessons}", file=sys.stderr)
+        return 1
+
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    benchmarks = run_benchmarks(args.lessons, lesson_paths, args.repeat)
+    run = {
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pdf_backend": os.environ.get("PDF_BACKEND", "pypdf2"),
+        "lessons": [Path(path).name for path in lesson_paths],
+        "lesson_megabytes": sum(os.path.getsize(path) for path in lesson_paths) / 1e6,
+        "benchmarks": benchmarks,
+    }
+    if args.memory_unit:
+        run["memory"] = measure_unit_memory(args.lessons, args.memory_unit)
+    out_path = Path(args.out) if args.out else cache_root() / "benchmarks" / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(run, indent=2), encoding="utf-8")
+    print(f"Wrote {out_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressed = compare_runs(baseline, run, args.threshold)
+        print()
+        _print_comparison(rows)
+        if regressed:
+            print(f"\n{len(regressed)} regression(s): {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
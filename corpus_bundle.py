@@ -0,0 +1,218 @@
+# Offline pre-processing of the lessons/ corpus into a single versioned bundle
+#
+# Build (or resume building) the bundle with:
+#   python corpus_bundle.py --lessons lessons/ --workers 4
+#
+# The bundle is one file, bundle.bin: a small JSON index followed by the UTF-8
+# text of every page. The app memory-maps it once at startup and slices page
+# text out of the map on demand. Processed PDFs are stored next to it.
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from extraction_backends import get_backend
+from lesson_catalog import LESSON_PATTERN
+from processed_pdfs import ensure_processed_pdf
+from text_cache import cache_root, file_digest, write_atomic
+
+# Bump when the bundle layout changes; older bundles are then ignored
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_MAGIC = b"LSNBNDL1"
+BUNDLE_FILE = "bundle.bin"
+
+_bundle = None
+_bundle_loaded = False
+
+
+def bundle_dir():
+    """Return the bundle directory (LESSON_BUNDLE_DIR overrides the default under the cache root)."""
+    return Path(os.environ.get("LESSON_BUNDLE_DIR", cache_root() / "bundle"))
+
+
+def _build_lesson(file_path, out_dir, backend_name):
+    """Extract one lesson and save its processed PDF; returns the lesson's part record."""
+    backend = get_backend(file_path, backend_name)
+    digest = file_digest(file_path)
+    pages = backend.extract_pages(file_path)
+
+    processed_path = ensure_processed_pdf(file_path, out_dir / "processed")
+
+    grade, unit, lesson = LESSON_PATTERN.match(Path(file_path).name).groups()
+    part = {
+        "full_name": Path(file_path).name,
+        "grade": int(grade),
+        "unit": int(unit),
+        "lesson": int(lesson),
+        "digest": digest,
+        "bytes": os.path.getsize(file_path),
+        "extractor": backend.version_tag(),
+        "page_count": len(pages),
+        "processed": str(processed_path.relative_to(out_dir)),
+        "pages": pages,
+    }
+    write_atomic(out_dir / "parts" / f"{digest}.json", json.dumps(part).encode("utf-8"))
+    return part
+
+
+def _load_part(out_dir, digest, extractor):
+    """Return a previously built part if it matches the digest and extractor, else None."""
+    part_path = out_dir / "parts" / f"{digest}.json"
+    try:
+        with open(part_path, "r", encoding="utf-8") as f:
+            part = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if part.get("extractor") != extractor or not (out_dir / part["processed"]).exists():
+        return None
+    return part
+
+
+def _assemble(parts, out_dir):
+    """Pack the per-lesson parts into bundle.bin."""
+    blob = bytearray()
+    lessons = {}
+    for part in sorted(parts, key=lambda p: (p["grade"], p["unit"], p["lesson"])):
+        page_spans = []
+        for page in part["pages"]:
+            encoded = page.encode("utf-8")
+            page_spans.append([len(blob), len(encoded)])
+            blob += encoded
+        entry = {key: value for key, value in part.items() if key != "pages"}
+        entry["pages"] = page_spans
+        lessons[part["full_name"]] = entry
+
+    header = json.dumps({
+        "format": BUNDLE_FORMAT_VERSION,
+        "built_at": time.time(),
+        "lessons": lessons,
+    }).encode("utf-8")
+    write_atomic(out_dir / BUNDLE_FILE, BUNDLE_MAGIC + struct.pack("<Q", len(header)) + header + bytes(blob))
+
+
+def build_bundle(lessons_dir, out_dir=None, workers=None, backend_name=None, force=False, log=print):
+    """Build the bundle for every lesson in lessons_dir, reusing parts from earlier runs."""
+    out_dir = Path(out_dir) if out_dir else bundle_dir()
+    file_paths = sorted(
+        str(path) for path in Path(lessons_dir).glob("*.pdf")
+        if LESSON_PATTERN.fullmatch(path.name)
+    )
+
+    parts = []
+    todo = []
+    for file_path in file_paths:
+        extractor = get_backend(file_path, backend_name).version_tag()
+        part = None if force else _load_part(out_dir, file_digest(file_path), extractor)
+        if part:
+            parts.append(part)
+        else:
+            todo.append(file_path)
+    log(f"{len(file_paths)} lessons, {len(parts)} already built, {len(todo)} to build")
+
+    failed = 0
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_build_lesson, path, out_dir, backend_name): path for path in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    parts.append(future.result())
+                    log(f"[{done}/{len(todo)}] {os.path.basename(path)}")
+                except Exception as e:
+                    failed += 1
+                    log(f"[{done}/{len(todo)}] {os.path.basename(path)} FAILED: {e}")
+
+    _assemble(parts, out_dir)
+    log(f"Wrote {out_dir / BUNDLE_FILE} with {len(parts)} lessons ({failed} failed)")
+    return failed
+
+
+class CorpusBundle:
+    """Read-only view over a memory-mapped bundle.bin."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.root = self.path.parent
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f"{self.path} is not a lesson bundle")
+        (header_length,) = struct.unpack_from("<Q", self._map, len(BUNDLE_MAGIC))
+        header_start = len(BUNDLE_MAGIC) + 8
+        header = json.loads(self._map[header_start:header_start + header_length])
+        if header.get("format") != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"{self.path} has unsupported format {header.get('format')}")
+        self._blob_start = header_start + header_length
+        self.built_at = header["built_at"]
+        self.lessons = header["lessons"]
+
+    def _matching_entry(self, file_path, extractor=None):
+        """Return the lesson entry if it was built from this exact file content."""
+        entry = self.lessons.get(Path(file_path).name)
+        if entry is None or entry["digest"] != file_digest(file_path):
+            return None
+        if extractor is not None and entry["extractor"] != extractor:
+            return None
+        return entry
+
+    def has_pages(self, file_path, extractor=None):
+        return self._matching_entry(file_path, extractor) is not None
+
+    def page_texts(self, file_path, extractor=None):
+        """Return the list of page texts for a lesson, or None if the bundle is stale for it."""
+        entry = self._matching_entry(file_path, extractor)
+        if entry is None:
+            return None
+        start = self._blob_start
+        return [self._map[start + offset:start + offset + length].decode("utf-8") for offset, length in entry["pages"]]
+
+    def page_count(self, file_path):
+        entry = self._matching_entry(file_path)
+        return entry["page_count"] if entry else None
+
+    def processed_pdf(self, file_path):
+        """Return the path of the bundled processed PDF for a lesson, if present."""
+        entry = self._matching_entry(file_path)
+        if entry is None:
+            return None
+        processed_path = self.root / entry["processed"]
+        return str(processed_path) if processed_path.exists() else None
+
+
+def get_bundle():
+    """Load the bundle once per process; returns None when no usable bundle exists."""
+    global _bundle, _bundle_loaded
+    if not _bundle_loaded:
+        _bundle_loaded = True
+        path = bundle_dir() / BUNDLE_FILE
+        if path.exists():
+            try:
+                _bundle = CorpusBundle(path)
+            except (OSError, ValueError):
+                _bundle = None
+    return _bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-process lesson PDFs into a bundle the app loads at startup.")
+    parser.add_argument("--lessons", default=str(Path(__file__).parent / "lessons"),
+                        help="directory of lesson PDFs (default: lessons/)")
+    parser.add_argument("--out", help="bundle directory (default: LESSON_BUNDLE_DIR or .cache/bundle)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--backend", help="extraction backend (default: PDF_BACKEND or pypdf2)")
+    parser.add_argument("--force", action="store_true", help="rebuild every lesson instead of resuming")
+    args = parser.parse_args(argv)
+    failed = build_bundle(args.lessons, args.out, args.workers, args.backend, args.force)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
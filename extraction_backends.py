@@ -0,0 +1,170 @@
+# Interchangeable PDF text-extraction backends (PyPDF2 and PyMuPDF)
+#
+# Compare the backends on the lesson corpus with:
+#   python extraction_backends.py --compare lessons/
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import PyPDF2
+
+# Files at least this large use PyMuPDF when PDF_BACKEND is "auto"
+AUTO_SIZE_THRESHOLD = 1024 * 1024
+
+
+class ExtractionBackend:
+    """Base class for a text extractor that returns one string per page."""
+
+    name = None
+    version = None
+
+    def extract_pages(self, file_path):
+        raise NotImplementedError
+
+    def version_tag(self):
+        """Identifies output from this backend release in caches and bundles."""
+        return f"{self.name}-{self.version}"
+
+
+class PyPDF2Backend(ExtractionBackend):
+    """Pure-Python extractor; the app's original behaviour."""
+
+    name = "pypdf2"
+    version = PyPDF2.__version__
+
+    def extract_pages(self, file_path):
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [page.extract_text() for page in pdf_reader.pages]
+
+
+class PyMuPDFBackend(ExtractionBackend):
+    """MuPDF-based extractor, much faster on large lesson files."""
+
+    name = "pymupdf"
+    version = fitz.VersionBind
+
+    def extract_pages(self, file_path):
+        with fitz.open(file_path) as doc:
+            return [page.get_text() for page in doc]
+
+
+BACKENDS = {backend.name: backend() for backend in (PyPDF2Backend, PyMuPDFBackend)}
+
+
+def get_backend(file_path=None, name=None):
+    """Pick the extraction backend for a file.
+
+    name defaults to the PDF_BACKEND environment variable ("pypdf2" if unset).
+    With "auto", large files go to PyMuPDF and small ones to PyPDF2.
+    """
+    if name is None:
+        name = os.environ.get("PDF_BACKEND", "pypdf2")
+    name = name.lower()
+    if name == "auto":
+        if file_path is not None and os.path.getsize(file_path) >= AUTO_SIZE_THRESHOLD:
+            return BACKENDS["pymupdf"]
+        return BACKENDS["pypdf2"]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}'. Choose from: auto, {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def _word_overlap(text_a, text_b):
+    """Share of words (as a multiset) the two outputs have in common, from 0 to 1."""
+    words_a = Counter(text_a.split())
+    words_b = Counter(text_b.split())
+    union = sum((words_a | words_b).values())
+    if not union:
+        return 1.0
+    return sum((words_a & words_b).values()) / union
+
+
+def compare_backends(file_paths, backend_names=None):
+    """Run every backend over each file and collect timings and output differences."""
+    backend_names = backend_names or list(BACKENDS)
+    rows = []
+    for file_path in file_paths:
+        row = {"file": os.path.basename(file_path), "bytes": os.path.getsize(file_path)}
+        texts = {}
+        for name in backend_names:
+            start = time.perf_counter()
+            try:
+                pages = BACKENDS[name].extract_pages(file_path)
+                error = None
+            except Exception as e:
+                pages, error = [], str(e)
+            row[name] = {
+                "seconds": time.perf_counter() - start,
+                "pages": len(pages),
+                "chars": sum(len(page) for page in pages),
+                "error": error,
+            }
+            texts[name] = "\n".join(pages)
+        if len(backend_names) == 2:
+            row["word_overlap"] = _word_overlap(*(texts[name] for name in backend_names))
+        rows.append(row)
+    return rows
+
+
+def _print_report(rows, backend_names):
+    header = f"{'file':<24}{'MB':>7}" + "".join(f"{name + ' s':>12}{name + ' chars':>16}" for name in backend_names)
+    if len(backend_names) == 2:
+        header += f"{'overlap':>9}"
+    print(header)
+    for row in rows:
+        line = f"{row['file']:<24}{row['bytes'] / 1e6:>7.2f}"
+        for name in backend_names:
+            stats = row[name]
+            chars = "ERROR" if stats["error"] else stats["chars"]
+            line += f"{stats['seconds']:>12.3f}{chars:>16}"
+        if "word_overlap" in row:
+            line += f"{row['word_overlap']:>9.1%}"
+        print(line)
+
+    print()
+    total_mb = sum(row["bytes"] for row in rows) / 1e6
+    for name in backend_names:
+        seconds = sum(row[name]["seconds"] for row in rows)
+        errors = sum(1 for row in rows if row[name]["error"])
+        print(f"{name}: {seconds:.2f} s total, {seconds / max(total_mb, 1e-9):.3f} s/MB, {errors} errors")
+    if rows and "word_overlap" in rows[0]:
+        overlaps = sorted(row["word_overlap"] for row in rows)
+        print(f"word overlap: median {overlaps[len(overlaps) // 2]:.1%}, min {overlaps[0]:.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare PDF text-extraction backends on lesson PDFs.")
+    parser.add_argument("--compare", metavar="DIR", default=str(Path(__file__).parent / "lessons"),
+                        help="directory of lesson PDFs to compare (default: lessons/)")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--limit", type=int, help="only compare the first N files")
+    parser.add_argument("--json", metavar="PATH", help="also write the raw results to a JSON file")
+    args = parser.parse_args(argv)
+
+    file_paths = sorted(
+        str(path) for path in Path(args.compare).glob("*.pdf")
+        if not path.stem.endswith("_processed")
+    )
+    if args.limit:
+        file_paths = file_paths[:args.limit]
+    if not file_paths:
+        print(f"No PDFs found in {args.compare}", file=sys.stderr)
+        return 1
+
+    rows = compare_backends(file_paths, args.backends)
+    _print_report(rows, args.backends)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
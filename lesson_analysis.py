@@ -0,0 +1,279 @@
+# Prompt construction and request fan-out for lesson analysis, independent of the Streamlit UI
+
+import asyncio
+import hashlib
+import os
+from collections import namedtuple
+from pathlib import Path
+
+from analysis_cache import analysis_cache_key, lesson_content_hash
+
+# Model settings; both are part of the analysis cache key
+MODEL_NAME = "gemini-2.5-flash-preview-05-20"
+GENERATION_CONFIG = {"max_output_tokens": 8192}
+
+INSTRUCTIONS_PATH = Path(__file__).parent / "instructions.txt"
+DEFAULT_INSTRUCTIONS = """
+            Please analyze the following combination of lessons based on the provided math standards.
+
+            Provide a comprehensive analysis including:
+            1. How well the lessons addresses the specified standards
+            2. Alignment with the provided standard
+            3. Strengths of the lessons
+            4. Areas for improvement
+            5. Suggested modifications or extensions
+            """
+
+# Settings below are read from the environment when used, so values from .env
+# apply however early this module is imported.
+
+# Prompts estimated above this many tokens are analyzed map-reduce style (MAP_REDUCE_THRESHOLD_TOKENS)
+DEFAULT_MAP_REDUCE_THRESHOLD_TOKENS = 150_000
+# Largest piece of lesson text sent in one map request (MAP_CHUNK_TOKENS)
+DEFAULT_MAP_CHUNK_TOKENS = 60_000
+
+# Most map requests allowed in flight at once (MAP_CONCURRENCY)
+DEFAULT_MAP_CONCURRENCY = 4
+# How often (seconds) a fan-out checks whether it should keep going
+FAN_OUT_POLL_SECONDS = 0.5
+
+# Rough characters-per-token ratio for English lesson text
+CHARS_PER_TOKEN = 4
+
+# Most lesson text (in MB of characters) one analysis may hold in memory (LESSON_TEXT_CEILING_MB)
+DEFAULT_LESSON_TEXT_CEILING_MB = 64
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used to pick the analysis mode (no API call)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def build_prompt(instructions, standards, lesson_text):
+    """Prompt that analyzes all lessons in a single request."""
+    return f"""
+    {instructions}
+
+    MATH STANDARDS:
+    {standards}
+
+
+    LESSON:
+    {lesson_text}
+    """
+
+
+def build_lessons_prompt(instructions, standards, lesson_texts):
+    """build_prompt with the lesson texts as the lesson, each followed by a blank line,
+    joined once instead of copying a combined lesson text into the template."""
+    head, _, tail = build_prompt(instructions, standards, "\0").rpartition("\0")
+    return "".join([head, *(text + "\n\n" for text in lesson_texts), tail])
+
+
+def needs_map_reduce(prompt):
+    """True when a single-request prompt is too large to send as is."""
+    threshold = int(os.environ.get("MAP_REDUCE_THRESHOLD_TOKENS", DEFAULT_MAP_REDUCE_THRESHOLD_TOKENS))
+    return estimate_tokens(prompt) > threshold
+
+
+class AnalysisPlan(namedtuple("AnalysisPlan", ["prompt", "mode", "cache_key"])):
+    """How a set of (name, text) lessons will be analyzed: the single-request
+    prompt, "single" or "map_reduce", and the analysis cache key."""
+
+
+def plan_analysis(instructions, standards, lessons, model_name=MODEL_NAME, lesson_hashes=None):
+    """Build the AnalysisPlan for lessons, a list of (name, text) pairs.
+
+    lesson_hashes may be passed when already known (see assemble_lessons).
+    """
+    prompt = build_lessons_prompt(instructions, standards, (text for _, text in lessons))
+    mode = "map_reduce" if needs_map_reduce(prompt) else "single"
+    if lesson_hashes is None:
+        lesson_hashes = [lesson_content_hash(text) for _, text in lessons]
+    cache_key = analysis_cache_key(instructions, standards, lesson_hashes, model_name, GENERATION_CONFIG, mode)
+    return AnalysisPlan(prompt, mode, cache_key)
+
+
+class MemoryCeilingExceeded(Exception):
+    """Raised when the text of a lesson selection outgrows LESSON_TEXT_CEILING_MB."""
+
+
+class AssembledLessons(namedtuple("AssembledLessons", ["paths", "lessons", "pages", "hashes", "page_count", "text_chars"])):
+    """Lessons gathered from a page stream.
+
+    lessons holds (name, text) pairs and hashes their lesson_content_hash, or,
+    when pages were kept, pages holds (name, [page text, ...]) pairs instead.
+    """
+
+
+def assemble_lessons(records, clean=None, keep_pages=False, ceiling_mb=None):
+    """Gather a stream of page records (lesson, page, text) into lessons in one pass.
+
+    Each page is cleaned and appended to its lesson as it arrives; a lesson's
+    text is joined once when its last page has been seen and its content hash
+    is updated page by page, so no other copy of the text is made. Raises
+    MemoryCeilingExceeded as soon as the text held passes ceiling_mb.
+    """
+    ceiling_mb = ceiling_mb or float(os.environ.get("LESSON_TEXT_CEILING_MB", DEFAULT_LESSON_TEXT_CEILING_MB))
+    ceiling_chars = ceiling_mb * 1024 * 1024
+    paths, lessons, lesson_pages, hashes = [], [], [], []
+    current_path, current_pages, sha = None, [], None
+    page_count = text_chars = 0
+
+    def finish_lesson():
+        paths.append(current_path)
+        name = os.path.basename(current_path)
+        if keep_pages:
+            lesson_pages.append((name, current_pages))
+        else:
+            lessons.append((name, "".join(current_pages)))
+            hashes.append(sha.hexdigest())
+
+    for record in records:
+        if record.lesson != current_path:
+            if current_path is not None:
+                finish_lesson()
+            current_path, current_pages, sha = record.lesson, [], hashlib.sha256()
+        text = clean(record.text) if clean else record.text
+        if keep_pages:
+            current_pages.append(text)
+        else:
+            piece = text + "\n"  # Same layout as join_pages
+            current_pages.append(piece)
+            sha.update(piece.encode("utf-8"))
+        page_count += 1
+        text_chars += len(text)
+        if text_chars > ceiling_chars:
+            raise MemoryCeilingExceeded(
+                f"The selected lessons passed the {ceiling_mb:g} MB lesson text limit after {page_count} pages. "
+                "Select fewer lessons or raise LESSON_TEXT_CEILING_MB."
+            )
+    if current_path is not None:
+        finish_lesson()
+    return AssembledLessons(paths, lessons, lesson_pages if keep_pages else None, hashes, page_count, text_chars)
+
+
+def split_lessons(lessons, max_chunk_tokens=None):
+    """Split (label, text) lessons into map-sized (label, text) pieces.
+
+    Lessons that fit stay whole; larger ones are cut on line boundaries and
+    labelled "part i of n".
+    """
+    max_chunk_tokens = max_chunk_tokens or int(os.environ.get("MAP_CHUNK_TOKENS", DEFAULT_MAP_CHUNK_TOKENS))
+    max_chars = max_chunk_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for label, text in lessons:
+        if len(text) <= max_chars:
+            pieces.append((label, text))
+            continue
+        chunks = []
+        current = []
+        current_size = 0
+        for line in text.splitlines(keepends=True):
+            if current and current_size + len(line) > max_chars:
+                chunks.append("".join(current))
+                current, current_size = [], 0
+            current.append(line)
+            current_size += len(line)
+        if current:
+            chunks.append("".join(current))
+        for i, chunk in enumerate(chunks, 1):
+            pieces.append((f"{label} (part {i} of {len(chunks)})", chunk))
+    return pieces
+
+
+def build_map_prompt(standards, label, lesson_text):
+    """Prompt that collects coverage evidence from one lesson or lesson part."""
+    return f"""
+    You are reviewing one part of a larger set of lessons for coverage of the math standards below.
+    Do not write the final coverage report. Instead, list each requirement of the standards
+    (concepts, skills, representations, contexts and grade-level limits) that this lesson text
+    addresses. For each one give brief evidence (quote or paraphrase the activity or problem)
+    and say whether it is fully or only partially addressed. Be concise.
+
+    MATH STANDARDS:
+    {standards}
+
+
+    LESSON: {label}
+    {lesson_text}
+    """
+
+
+def build_reduce_prompt(instructions, standards, partial_results):
+    """Prompt that merges (label, findings) map results into the final coverage analysis."""
+    findings = "\n\n".join(f"### {label}\n{result}" for label, result in partial_results)
+    return f"""
+    {instructions}
+
+    MATH STANDARDS:
+    {standards}
+
+
+    The lessons were too long to analyze in one request, so each lesson (or part of a lesson)
+    was reviewed separately. Combine the findings below into one coverage analysis that follows
+    the Output Template above. Treat a requirement as met if any lesson meets it, and base the
+    analysis only on these findings.
+
+    LESSON FINDINGS:
+    {findings}
+    """
+
+
+class AnalysisCancelled(Exception):
+    """Raised when a fan-out is stopped because its caller went away."""
+
+
+async def fan_out(request, items, concurrency=None, on_result=None, should_continue=None):
+    """Run request(item) for every item concurrently, at most `concurrency` at a time.
+
+    on_result(index, result) is called as each request finishes, in completion
+    order. Results are returned in the order of items. If a request fails,
+    on_result raises, or should_continue() returns False (raising
+    AnalysisCancelled), every outstanding request is cancelled.
+    """
+    semaphore = asyncio.Semaphore(concurrency or int(os.environ.get("MAP_CONCURRENCY", DEFAULT_MAP_CONCURRENCY)))
+
+    async def run(index, item):
+        async with semaphore:
+            return index, await request(item)
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    results = [None] * len(tasks)
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=FAN_OUT_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                index, result = task.result()
+                results[index] = result
+                if on_result is not None:
+                    on_result(index, result)
+            if pending and should_continue is not None and not should_continue():
+                raise AnalysisCancelled("Analysis cancelled before all requests finished")
+        return results
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def analyze_async(client, instructions, standards, lessons, plan, concurrency=None, on_wait=None):
+    """Run a planned analysis through a ModelClient without any UI; returns the analysis text.
+
+    Map-reduce plans analyze each lesson piece concurrently (at most
+    `concurrency` requests at once) before the final reduce request.
+    """
+    if plan.mode == "single":
+        return await client.generate_text_async(plan.prompt, on_wait=on_wait)
+    pieces = split_lessons(lessons)
+    partials = await fan_out(
+        lambda piece: client.generate_text_async(build_map_prompt(standards, *piece), on_wait=on_wait),
+        pieces,
+        concurrency=concurrency,
+    )
+    partial_results = [(label, partial) for (label, _), partial in zip(pieces, partials)]
+    return await client.generate_text_async(build_reduce_prompt(instructions, standards, partial_results),
+                                            on_wait=on_wait)
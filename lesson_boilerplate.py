@@ -0,0 +1,231 @@
+# Corpus-level detection and stripping of page furniture repeated across lessons
+#
+# Find the boilerplate lines of the lessons/ corpus with:
+#   python lesson_boilerplate.py             # writes .cache/boilerplate/lines-v1-<extractor>.json, prints the top lines
+#   python lesson_boilerplate.py --show 50 --min-share 0.2
+#
+# A line is boilerplate when, with whitespace collapsed, it has at least
+# BOILERPLATE_MIN_CHARS characters (and a few letters, so numbers and axis
+# labels never qualify) and appears in at least BOILERPLATE_MIN_LESSON_SHARE
+# of all lessons: "Please log in to the site", recurring directions,
+# accessibility support blurbs and the like. The app strips those lines from
+# page text before the prompt is assembled. The lines are saved per extractor
+# (PDF_BACKEND), since each backend lays out the same page differently.
+#
+# False positives are overridden per lesson in boilerplate_whitelist.json
+# (BOILERPLATE_WHITELIST overrides the path); "*" applies to every lesson.
+# Entries match whatever the spacing, so "Student Task Statement" also keeps
+# PyPDF2's "Student T ask Statement":
+#
+#   {"6.02.06.pdf": ["Explain your reasoning."], "*": ["Lesson Summary"]}
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from extraction_backends import BACKENDS, get_backend
+from lesson_analysis import CHARS_PER_TOKEN
+from lesson_catalog import LESSON_PATTERN, LESSONS_DIR
+from lesson_extraction import PageRecord, extractor_version, iter_lesson_pages
+from text_cache import cache_root, write_atomic
+
+# Bump when detection changes; older line files are then ignored
+BOILERPLATE_VERSION = 1
+DEFAULT_MIN_LESSON_SHARE = 0.1
+DEFAULT_MIN_CHARS = 12
+# Letters a line needs before it can count as boilerplate
+MIN_LETTERS = 4
+
+WHITELIST_PATH = Path(__file__).parent / "boilerplate_whitelist.json"
+
+_boilerplate = None  # (stamps of the lines and whitelist files, Boilerplate or None)
+_boilerplate_lock = threading.Lock()
+
+
+def normalize_line(line):
+    """Collapse runs of whitespace, so lines match however the extractor padded them."""
+    return " ".join(line.split())
+
+
+def whitelist_key(line):
+    """Whitelist matching key: the line without any whitespace, so extractor spacing does not matter."""
+    return "".join(line.split())
+
+
+def lines_extractor():
+    """The extractor versions behind the page text, for keying the lines file ("auto" uses both backends)."""
+    if os.environ.get("PDF_BACKEND", "pypdf2").lower() == "auto":
+        backends = BACKENDS.values()
+    else:
+        backends = [get_backend()]
+    return "+".join(extractor_version(backend) for backend in backends)
+
+
+def lines_path():
+    return cache_root() / "boilerplate" / f"lines-v{BOILERPLATE_VERSION}-{lines_extractor()}.json"
+
+
+def whitelist_path():
+    return Path(os.environ.get("BOILERPLATE_WHITELIST", WHITELIST_PATH))
+
+
+def find_boilerplate(records, lesson_total, min_lesson_share=None, min_chars=None):
+    """Count the lessons each line appears in over a page stream; returns {line: lessons} for boilerplate lines."""
+    if min_lesson_share is None:
+        min_lesson_share = float(os.environ.get("BOILERPLATE_MIN_LESSON_SHARE", DEFAULT_MIN_LESSON_SHARE))
+    if min_chars is None:
+        min_chars = int(os.environ.get("BOILERPLATE_MIN_CHARS", DEFAULT_MIN_CHARS))
+    lesson_counts = Counter()
+    current_lesson, current_lines = None, set()
+    for record in records:
+        if record.lesson != current_lesson:
+            lesson_counts.update(current_lines)
+            current_lesson, current_lines = record.lesson, set()
+        for line in record.text.split("\n"):
+            line = normalize_line(line)
+            if len(line) >= min_chars and sum(character.isalpha() for character in line) >= MIN_LETTERS:
+                current_lines.add(line)
+    lesson_counts.update(current_lines)
+    min_lessons = max(2, math.ceil(min_lesson_share * lesson_total))
+    return {line: count for line, count in lesson_counts.most_common() if count >= min_lessons}
+
+
+class BoilerplateStripper:
+    """Strips boilerplate from the pages of one analysis and counts what was removed."""
+
+    def __init__(self, boilerplate):
+        self.boilerplate = boilerplate
+        self.removed_lines = 0
+        self.removed_chars = 0
+
+    @property
+    def tokens_saved(self):
+        return self.removed_chars // CHARS_PER_TOKEN
+
+    def strip_page(self, lesson, text):
+        """Return page text without boilerplate lines, keeping the lesson's whitelisted ones."""
+        lines = self.boilerplate.lines
+        keep = self.boilerplate.whitelisted(os.path.basename(lesson))
+        kept = []
+        for line in text.split("\n"):
+            normalized = normalize_line(line)
+            if normalized in lines and whitelist_key(normalized) not in keep:
+                self.removed_lines += 1
+                self.removed_chars += len(line) + 1
+            else:
+                kept.append(line)
+        return "\n".join(kept)
+
+    def strip(self, records):
+        """Stream page records with boilerplate removed (for assemble_lessons)."""
+        for record in records:
+            yield PageRecord(record.lesson, record.page, self.strip_page(record.lesson, record.text))
+
+
+class Boilerplate:
+    """The corpus's boilerplate lines and the per-lesson whitelist."""
+
+    def __init__(self, lines, whitelist=None):
+        self.lines = frozenset(lines)
+        whitelist = whitelist or {}
+        self.keep_everywhere = frozenset(whitelist_key(line) for line in whitelist.get("*", ()))
+        self.whitelist = {
+            lesson: frozenset(whitelist_key(line) for line in keep) | self.keep_everywhere
+            for lesson, keep in whitelist.items() if lesson != "*"
+        }
+
+    def whitelisted(self, lesson_name):
+        return self.whitelist.get(lesson_name, self.keep_everywhere)
+
+    def stripper(self):
+        return BoilerplateStripper(self)
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_whitelist(path=None):
+    try:
+        with open(path or whitelist_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def get_boilerplate():
+    """Return the process-wide Boilerplate, or None until lesson_boilerplate.py has been run.
+
+    The lines file and the whitelist are re-read only when either changes on disk.
+    """
+    global _boilerplate
+    stamps = (_file_stamp(lines_path()), _file_stamp(whitelist_path()))
+    with _boilerplate_lock:
+        if _boilerplate is not None and _boilerplate[0] == stamps:
+            return _boilerplate[1]
+        boilerplate = None
+        if stamps[0] is not None:
+            with open(lines_path(), "r", encoding="utf-8") as f:
+                boilerplate = Boilerplate(json.load(f)["lines"], load_whitelist())
+        _boilerplate = (stamps, boilerplate)
+        return boilerplate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find lines repeated across the lesson corpus and save them.")
+    parser.add_argument("--lessons", default=str(LESSONS_DIR), help="directory of lesson PDFs (default: lessons/)")
+    parser.add_argument("--workers", type=int, help="extraction processes (default: EXTRACTION_WORKERS or CPU count)")
+    parser.add_argument("--min-share", type=float,
+                        help=f"share of lessons a line must appear in (default: BOILERPLATE_MIN_LESSON_SHARE "
+                             f"or {DEFAULT_MIN_LESSON_SHARE})")
+    parser.add_argument("--min-chars", type=int,
+                        help=f"shortest line considered (default: BOILERPLATE_MIN_CHARS or {DEFAULT_MIN_CHARS})")
+    parser.add_argument("--show", type=int, default=20, help="boilerplate lines to print (default: 20)")
+    args = parser.parse_args(argv)
+
+    file_paths = sorted(
+        str(path) for path in Path(args.lessons).glob("*.pdf") if LESSON_PATTERN.match(path.name)
+    )
+    if not file_paths:
+        print(f"No lessons found in {args.lessons}", file=sys.stderr)
+        return 1
+
+    failed = []
+    records = iter_lesson_pages(file_paths, max_workers=args.workers,
+                                on_error=lambda path, error: failed.append(path))
+    lines = find_boilerplate(records, len(file_paths), args.min_share, args.min_chars)
+    for path in failed:
+        print(f"Skipped {Path(path).name}: could not extract text", file=sys.stderr)
+    write_atomic(lines_path(), json.dumps({
+        "version": BOILERPLATE_VERSION,
+        "extractor": lines_extractor(),
+        "lessons": len(file_paths) - len(failed),
+        "lines": lines,
+    }, indent=1).encode("utf-8"))
+
+    # What stripping saves over the whole corpus, with the current whitelist
+    stripper = Boilerplate(lines, load_whitelist()).stripper()
+    total_chars = 0
+    for record in iter_lesson_pages([path for path in file_paths if path not in failed], max_workers=args.workers):
+        total_chars += len(record.text) + 1
+        stripper.strip_page(record.lesson, record.text)
+    print(f"{len(lines)} boilerplate lines in {len(file_paths) - len(failed)} lessons; stripping removes "
+          f"{stripper.removed_lines:,} lines, {stripper.removed_chars / max(total_chars, 1):.1%} of the text "
+          f"(~{stripper.tokens_saved // max(len(file_paths) - len(failed), 1):,} tokens per lesson)")
+    print(f"Saved {os.path.relpath(lines_path())}")
+    for line, count in list(lines.items())[:args.show]:
+        print(f"  {count:4d}  {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# Process-wide catalog of lesson PDFs, rebuilt only when lessons/ changes
+
+import os
+import re
+import threading
+from pathlib import Path
+
+from text_cache import forget_file
+
+LESSONS_DIR = Path(__file__).parent / "lessons"
+
+# Regular expression to match lesson file patterns like "6.02.06.pdf"
+LESSON_PATTERN = re.compile(r"(\d+)\.(\d+)\.(\d+)\.pdf")
+
+# lessons dir -> (signature, nested dict, LessonCatalog)
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+# Called as callback(file_path, old_digests) when a lesson file changes or is removed
+_change_callbacks = []
+
+
+def on_lesson_change(callback):
+    """Register a callback that drops data derived from a changed lesson file.
+
+    Callbacks receive the file path and the content digests the file had
+    before it changed (only digests seen by this process are known).
+    """
+    _change_callbacks.append(callback)
+    return callback
+
+
+def directory_signature(lessons_dir):
+    """Map of PDF name -> (mtime, size); cheap to compute and changes with any edit."""
+    signature = {}
+    with os.scandir(lessons_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".pdf") and entry.is_file():
+                stat = entry.stat()
+                signature[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+def scan_lessons(lessons_dir, file_names):
+    """Organize lesson PDFs by grade and unit."""
+    # Dictionary to store lessons by grade and unit
+    lessons_by_grade_and_unit = {}
+
+    for file_name in file_names:
+        match = LESSON_PATTERN.match(file_name)
+
+        if match:
+            grade, unit, lesson = match.groups()
+            grade_key = f"Grade {int(grade)}"  # Convert "6" to "Grade 6"
+            unit_key = f"Unit {int(unit)}"    # Convert "02" to "Unit 2"
+            lesson_number = int(lesson)      # Convert "06" to 6
+
+            # Create simplified lesson name for display
+            lesson_name = f"Lesson {lesson_number}"
+
+            # Add to dictionary
+            if grade_key not in lessons_by_grade_and_unit:
+                lessons_by_grade_and_unit[grade_key] = {}
+            if unit_key not in lessons_by_grade_and_unit[grade_key]:
+                lessons_by_grade_and_unit[grade_key][unit_key] = []
+
+            lessons_by_grade_and_unit[grade_key][unit_key].append({
+                "name": lesson_name,
+                "path": str(Path(lessons_dir) / file_name),
+                "number": lesson_number,    # Store lesson number for sorting
+                "full_name": file_name      # Keep original filename for reference
+            })
+
+    # Sort grades, units, and lessons by numerical order
+    return {
+        grade: {
+            unit: sorted(lessons, key=lambda x: x["number"])
+            for unit, lessons in sorted(units.items())
+        }
+        for grade, units in sorted(lessons_by_grade_and_unit.items())
+    }
+
+
+class LessonRecord:
+    """One lesson PDF in the catalog."""
+
+    __slots__ = ("index", "grade", "unit", "number", "name", "path", "full_name", "display_name")
+
+    def __init__(self, index, grade, unit, lesson):
+        self.index = index            # Position in catalog (grade, unit, lesson) order
+        self.grade = grade            # e.g. "Grade 6"
+        self.unit = unit              # e.g. "Unit 2"
+        self.number = lesson["number"]
+        self.name = lesson["name"]
+        self.path = lesson["path"]
+        self.full_name = lesson["full_name"]
+        self.display_name = f"{grade} - {unit} - {self.name} ({self.full_name})"
+
+
+class LessonCatalog:
+    """Lesson records with constant-time lookups, built once per catalog scan."""
+
+    def __init__(self, lessons_by_grade_and_unit):
+        records = []
+        self.by_grade = {}
+        self.by_unit = {}
+        for grade, units in lessons_by_grade_and_unit.items():
+            for unit, lessons in units.items():
+                unit_records = []
+                for lesson in lessons:
+                    record = LessonRecord(len(records), grade, unit, lesson)
+                    records.append(record)
+                    unit_records.append(record)
+                self.by_unit[(grade, unit)] = tuple(unit_records)
+                self.by_grade[grade] = self.by_grade.get(grade, ()) + tuple(unit_records)
+        self.records = tuple(records)
+        self.display_names = tuple(record.display_name for record in records)
+        self.by_display_name = {record.display_name: record for record in records}
+        self.by_path = {record.path: record for record in records}
+        self.by_lesson = {(record.grade, record.unit, record.number): record for record in records}
+
+    def grades(self):
+        return list(self.by_grade)
+
+    def units(self, grade):
+        return [unit for grade_key, unit in self.by_unit if grade_key == grade]
+
+    def lessons_in_unit(self, grade, unit):
+        return self.by_unit.get((grade, unit), ())
+
+    def lessons_in_grade(self, grade):
+        return self.by_grade.get(grade, ())
+
+    def lesson(self, grade, unit, number):
+        return self.by_lesson.get((grade, unit, number))
+
+    def resolve_display_names(self, display_names):
+        """Records for selected display names, in catalog order; unknown names are skipped."""
+        records = (self.by_display_name.get(name) for name in display_names)
+        return sorted((record for record in records if record is not None), key=lambda record: record.index)
+
+
+def _notify_changes(lessons_dir, old_signature, new_signature):
+    """Run change callbacks for every lesson that was modified or removed."""
+    for file_name, stamp in old_signature.items():
+        if new_signature.get(file_name) != stamp:
+            file_path = str(Path(lessons_dir) / file_name)
+            old_digests = forget_file(file_path)
+            for callback in _change_callbacks:
+                callback(file_path, old_digests)
+
+
+def _current_catalog(lessons_dir):
+    """Return the cached (nested dict, LessonCatalog) pair, rescanning only on changes."""
+    key = str(lessons_dir)
+    signature = directory_signature(lessons_dir)
+    with _catalogs_lock:
+        cached = _catalogs.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        if cached is not None:
+            _notify_changes(lessons_dir, cached[0], signature)
+        lessons_by_grade_and_unit = scan_lessons(lessons_dir, signature)
+        catalog = LessonCatalog(lessons_by_grade_and_unit)
+        _catalogs[key] = (signature, lessons_by_grade_and_unit, catalog)
+        return lessons_by_grade_and_unit, catalog
+
+
+def get_lessons_by_grade_and_unit(lessons_dir=LESSONS_DIR):
+    """Return the catalog for lessons_dir, rescanning only when its contents changed.
+
+    The returned dict is shared by every session and must not be modified.
+    """
+    return _current_catalog(lessons_dir)[0]
+
+
+def get_lesson_catalog(lessons_dir=LESSONS_DIR):
+    """Return the indexed LessonCatalog for lessons_dir (shared, read-only)."""
+    return _current_catalog(lessons_dir)[1]
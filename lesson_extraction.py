@@ -0,0 +1,242 @@
+# Lesson text extraction that can run outside the Streamlit script (e.g. in worker processes)
+
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from corpus_bundle import get_bundle
+from extraction_backends import get_backend
+from lesson_catalog import on_lesson_change
+from text_cache import TextCache, file_digest
+
+# Bump whenever the cached text format changes, to invalidate cached text
+EXTRACTOR_VERSION = 2
+
+# Separates pages inside a text cache entry, so page boundaries survive caching
+PAGE_SEPARATOR = "\f"
+
+# Created on first use, so LESSON_CACHE_DIR and LESSON_TEXT_CACHE_MAX_BYTES from .env apply
+_text_cache = None
+
+
+def get_text_cache():
+    """Return the process-wide text cache."""
+    global _text_cache
+    if _text_cache is None:
+        _text_cache = TextCache()
+    return _text_cache
+
+# Worker pool shared by every session in this process, created on first use
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def join_pages(pages):
+    """Join page texts into one lesson text, one page per line block."""
+    return "".join(page + "\n" for page in pages)
+
+
+class ExtractionResult(namedtuple("ExtractionResult", ["path", "pages", "error"])):
+    """Outcome of extracting one lesson: pages is None when error is set."""
+
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return join_pages(self.pages) if self.pages is not None else None
+
+
+class PageRecord(namedtuple("PageRecord", ["lesson", "page", "text"])):
+    """One extracted page: lesson is the PDF path, page is 1-based."""
+
+    __slots__ = ()
+
+
+def clean_page(text):
+    """Drop trailing whitespace from every line of a page (PyPDF2 pads many lines with spaces)."""
+    return "\n".join(line.rstrip() for line in text.split("\n"))
+
+
+def extractor_version(backend):
+    """Cache version string for text produced by a backend."""
+    return f"{backend.version_tag()}-{EXTRACTOR_VERSION}"
+
+
+def _stored_pages(file_path, backend):
+    """Return the lesson's pages from the corpus bundle or text cache, or None on a miss."""
+    bundle = get_bundle()
+    if bundle is not None:
+        pages = bundle.page_texts(file_path, backend.version_tag())
+        if pages is not None:
+            return pages
+    cached_text = get_text_cache().get(file_digest(file_path), extractor_version(backend))
+    if cached_text is not None:
+        return cached_text.split(PAGE_SEPARATOR)
+    return None
+
+
+def _is_stored(file_path, backend):
+    """True when the lesson's pages can be read from the bundle or text cache without parsing."""
+    bundle = get_bundle()
+    if bundle is not None and bundle.has_pages(file_path, backend.version_tag()):
+        return True
+    return get_text_cache().contains(file_digest(file_path), extractor_version(backend))
+
+
+def extract_lesson_pages(file_path):
+    """Return the text of each page of a lesson PDF, parsing it only on a bundle and text cache miss."""
+    backend = get_backend(file_path)
+    pages = _stored_pages(file_path, backend)
+    if pages is None:
+        pages = [page.replace(PAGE_SEPARATOR, "\n") for page in backend.extract_pages(file_path)]
+        get_text_cache().put(file_digest(file_path), extractor_version(backend), PAGE_SEPARATOR.join(pages))
+    return pages
+
+
+def _extract_worker(file_path):
+    """Pool entry point: never raises, so one bad lesson cannot fail the batch."""
+    try:
+        return ExtractionResult(file_path, extract_lesson_pages(file_path), None)
+    except Exception as e:
+        return ExtractionResult(file_path, None, str(e))
+
+
+@on_lesson_change
+def _purge_changed_lesson(file_path, old_digests):
+    """Drop cached text of a lesson's previous contents."""
+    for digest in old_digests:
+        get_text_cache().purge(digest)
+
+
+def _get_pool(max_workers):
+    """Return the shared process pool, recreating it if the worker count changed or a worker died."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers or _pool._broken:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # "spawn" avoids forking the multi-threaded Streamlit server
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool(pool):
+    """Shut down a pool that broke (a worker died), so the next _get_pool builds a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return  # Already replaced
+        _pool = None
+    pool.shutdown(wait=False)
+
+
+def extract_lessons_parallel(file_paths, max_workers=None):
+    """Extract several lessons on a process pool.
+
+    Returns one ExtractionResult per path, in the same order as file_paths.
+    Lessons already in the corpus bundle or text cache are served directly; only the misses
+    are sent to worker processes.
+    """
+    results = [None] * len(file_paths)
+    misses = []
+    for i, file_path in enumerate(file_paths):
+        try:
+            pages = _stored_pages(file_path, get_backend(file_path))
+        except (OSError, ValueError) as e:
+            results[i] = ExtractionResult(file_path, None, str(e))
+            continue
+        if pages is not None:
+            results[i] = ExtractionResult(file_path, pages, None)
+        else:
+            misses.append(i)
+
+    if len(misses) == 1:
+        # Not worth a round trip through the pool
+        i = misses[0]
+        results[i] = _extract_worker(file_paths[i])
+    elif misses:
+        if max_workers is None:
+            max_workers = int(os.environ.get("EXTRACTION_WORKERS", os.cpu_count() or 1))
+        pool = _get_pool(max(1, min(max_workers, os.cpu_count() or 1)))
+        futures = {}
+        for i in misses:
+            try:
+                futures[i] = pool.submit(_extract_worker, file_paths[i])
+            except BrokenProcessPool as e:
+                _discard_pool(pool)
+                results[i] = ExtractionResult(file_paths[i], None, str(e))
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool as e:  # A worker died, taking the lessons still queued with it
+                _discard_pool(pool)
+                results[i] = ExtractionResult(file_paths[i], None, str(e))
+            except Exception as e:
+                results[i] = ExtractionResult(file_paths[i], None, str(e))
+    return results
+
+
+def iter_lesson_pages(file_paths, max_workers=None, on_error=None):
+    """Yield a PageRecord for every page of every lesson, in lesson then page order.
+
+    Lessons are read whole, one at a time: the current lesson in this process
+    while worker processes parse up to max_workers upcoming cache misses, so
+    at most that many lessons are held ahead of the consumer. A lesson that
+    fails yields no pages; it calls on_error(path, message) (or raises when
+    on_error is None) and the records move on to the next lesson.
+    """
+    if max_workers is None:
+        max_workers = int(os.environ.get("EXTRACTION_WORKERS", os.cpu_count() or 1))
+    workers = max(1, min(max_workers, os.cpu_count() or 1))
+    ahead = {}  # lesson index -> (pool, future) of a lesson parsed in the pool
+    next_check = 0
+
+    def is_miss(index):
+        try:
+            return not _is_stored(file_paths[index], get_backend(file_paths[index]))
+        except (OSError, ValueError):
+            return False  # Reported when the lesson is reached
+
+    try:
+        for i, file_path in enumerate(file_paths):
+            if workers > 1:
+                next_check = max(next_check, i + 1)
+                while next_check < len(file_paths) and len(ahead) < workers:
+                    if is_miss(next_check):
+                        pool = _get_pool(workers)
+                        try:
+                            ahead[next_check] = (pool, pool.submit(_extract_worker, file_paths[next_check]))
+                        except BrokenProcessPool:
+                            # Not queued; the lesson is read in this process when it is reached
+                            _discard_pool(pool)
+                    next_check += 1
+            pool, future = ahead.pop(i, (None, None))
+            try:
+                if future is not None:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        _discard_pool(pool)
+                        raise
+                    if result.error:
+                        raise ValueError(result.error)
+                    pages = result.pages
+                else:
+                    pages = extract_lesson_pages(file_path)
+                for number, text in enumerate(pages, 1):
+                    yield PageRecord(file_path, number, text)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(file_path, str(e))
+    finally:
+        for _, future in ahead.values():
+            future.cancel()
@@ -0,0 +1,301 @@
+# Precomputed TF-IDF relevance of every lesson to every MATH_STANDARDS entry, for lesson suggestions
+#
+# Build (or bring up to date) the standard x lesson matrix with:
+#   python lesson_relevance.py                     # only changed lessons are re-read
+#   python lesson_relevance.py --show MA.6.NSO.1.1 # also print the top lessons for a standard
+#
+# Each lesson's term counts are stored next to the matrix, keyed by the
+# lesson's content digest. A rebuild tokenizes only lessons that are new or
+# changed, then recomputes the IDF weights and the whole matrix from the
+# stored counts, which takes well under a second with NumPy. The app loads the
+# matrix once and brings it up to date the same way when lessons change.
+
+import argparse
+import hashlib
+import io
+import math
+import os
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from lesson_catalog import LESSON_PATTERN, LESSONS_DIR, directory_signature
+from lesson_extraction import iter_lesson_pages
+from page_retrieval import standard_query_text, tokenize
+from standards_index import STANDARDS_INDEX
+from text_cache import cache_root, file_digest, write_atomic
+
+# Bump when tokenization or weighting changes; older files are then rebuilt from scratch
+RELEVANCE_FORMAT_VERSION = 1
+DEFAULT_SUGGESTED_LESSONS = 5
+# Most changed lessons the app re-reads inline before leaving the rebuild to this script
+DEFAULT_RELEVANCE_INLINE_REBUILD = 10
+
+# lessons dir -> (signature, RelevanceIndex)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def relevance_path():
+    return cache_root() / "relevance" / f"relevance-v{RELEVANCE_FORMAT_VERSION}.npz"
+
+
+def standards_digest(standard_ids):
+    """Digest of the standards text the matrix rows were computed from."""
+    sha = hashlib.sha256()
+    for standard_id in standard_ids:
+        sha.update(f"{standard_id}\0{standard_query_text(standard_id)}\0".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _l2_normalize(weights, indptr):
+    """Scale each row of CSR weights to unit length (empty rows stay empty)."""
+    lengths = np.diff(indptr)
+    squares = np.zeros(len(lengths))
+    nonempty = lengths > 0
+    squares[nonempty] = np.add.reduceat(weights ** 2, indptr[:-1][nonempty])
+    norms = np.repeat(np.sqrt(squares), lengths)
+    return np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+
+class RelevanceIndex:
+    """Cosine similarity of TF-IDF vectors: one row per standard, one column per lesson.
+
+    Lesson term counts are kept in CSR form over a sorted vocabulary (indptr,
+    indices, counts), so a rebuild can reuse them for unchanged lessons.
+    """
+
+    def __init__(self, lesson_names, lesson_stamps, vocabulary, indptr, indices, counts,
+                 standard_ids=None, matrix=None, standards_key=None):
+        self.lesson_names = list(lesson_names)
+        self.lesson_stamps = lesson_stamps  # name -> (mtime_ns, size, digest)
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.column = {name: i for i, name in enumerate(self.lesson_names)}
+        self.standard_ids = list(standard_ids if standard_ids is not None else STANDARDS_INDEX.standards)
+        self.row = {standard_id: i for i, standard_id in enumerate(self.standard_ids)}
+        self.standards_key = standards_key or standards_digest(self.standard_ids)
+        self.matrix = matrix if matrix is not None else self._similarities()
+        self.stale_lessons = 0
+
+    def lesson_counts(self, name):
+        """{term: count} of one lesson."""
+        i = self.column[name]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return dict(zip(self.vocabulary[self.indices[start:end]].tolist(), self.counts[start:end].tolist()))
+
+    def _similarities(self):
+        """Standards x lessons cosine similarities from the stored term counts."""
+        lesson_total = len(self.lesson_names)
+        # Sublinear TF, smoothed IDF over the lesson corpus
+        document_frequency = np.bincount(self.indices, minlength=len(self.vocabulary))
+        idf = np.log((1 + lesson_total) / (1 + document_frequency)) + 1
+        weights = _l2_normalize((1 + np.log(self.counts)) * idf[self.indices], self.indptr)
+
+        # Standards are short, so their vectors are built dense over the lesson vocabulary
+        term_ids = {term: i for i, term in enumerate(self.vocabulary.tolist())}
+        queries = np.zeros((len(self.standard_ids), len(self.vocabulary)), dtype=np.float32)
+        for row, standard_id in enumerate(self.standard_ids):
+            for term, count in Counter(tokenize(standard_query_text(standard_id))).items():
+                column = term_ids.get(term)
+                if column is not None:
+                    queries[row, column] = (1 + math.log(count)) * idf[column]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+
+        matrix = np.zeros((len(self.standard_ids), lesson_total), dtype=np.float32)
+        for column in range(lesson_total):
+            start, end = self.indptr[column], self.indptr[column + 1]
+            matrix[:, column] = queries[:, self.indices[start:end]] @ weights[start:end]
+        return matrix
+
+    def suggest(self, standard_ids, top_n=None):
+        """Best matching (lesson file name, score) pairs for standards, averaged over the standards."""
+        top_n = top_n or int(os.environ.get("SUGGESTED_LESSONS", DEFAULT_SUGGESTED_LESSONS))
+        rows = [self.row[standard_id] for standard_id in standard_ids if standard_id in self.row]
+        if not rows or not self.lesson_names:
+            return []
+        scores = self.matrix[rows].mean(axis=0)
+        top = np.argsort(-scores, kind="stable")[:top_n]
+        return [(self.lesson_names[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path=None):
+        names = self.lesson_names
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            lesson_names=np.array(names, dtype=str),
+            lesson_mtimes=np.array([self.lesson_stamps[name][0] for name in names], dtype=np.int64),
+            lesson_sizes=np.array([self.lesson_stamps[name][1] for name in names], dtype=np.int64),
+            lesson_digests=np.array([self.lesson_stamps[name][2] for name in names], dtype=str),
+            vocabulary=self.vocabulary,
+            indptr=self.indptr,
+            indices=self.indices,
+            counts=self.counts,
+            standard_ids=np.array(self.standard_ids, dtype=str),
+            standards_key=np.array(self.standards_key),
+            matrix=self.matrix,
+        )
+        write_atomic(path or relevance_path(), buffer.getvalue())
+
+    @classmethod
+    def load(cls, path=None):
+        """Read a saved index, or return None when there is none."""
+        try:
+            data = np.load(path or relevance_path(), allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        with data:
+            names = data["lesson_names"].tolist()
+            stamps = {
+                name: (int(mtime), int(size), digest)
+                for name, mtime, size, digest in zip(
+                    names, data["lesson_mtimes"], data["lesson_sizes"], data["lesson_digests"].tolist()
+                )
+            }
+            return cls(names, stamps, data["vocabulary"], data["indptr"], data["indices"], data["counts"],
+                       data["standard_ids"].tolist(), data["matrix"], str(data["standards_key"]))
+
+
+def changed_lessons(index, lessons_dir, signature):
+    """Lesson file names whose (mtime, size) differ from the index, plus any the index lacks."""
+    names = sorted(name for name in signature if LESSON_PATTERN.match(name))
+    if index is None:
+        return names
+    changed = []
+    for name in names:
+        stamp = index.lesson_stamps.get(name)
+        if stamp is None or stamp[:2] != signature[name]:
+            changed.append(name)
+    return changed
+
+
+def build_index(lessons_dir=LESSONS_DIR, previous=None, workers=None, log=None):
+    """Return an up-to-date RelevanceIndex, tokenizing only lessons new or changed since `previous`.
+
+    Lessons that fail to extract are left out (and logged).
+    """
+    signature = directory_signature(lessons_dir)
+    names = sorted(name for name in signature if LESSON_PATTERN.match(name))
+    changed = set(changed_lessons(previous, lessons_dir, signature))
+
+    term_counts = {}
+    stamps = {}
+    to_read = []
+    for name in names:
+        path = str(Path(lessons_dir) / name)
+        if name in changed:
+            digest = file_digest(path)
+            if previous is not None and previous.lesson_stamps.get(name, (None, None, None))[2] == digest:
+                changed.discard(name)  # Touched but not modified
+        else:
+            digest = previous.lesson_stamps[name][2]
+        stamps[name] = (*signature[name], digest)
+        if name in changed:
+            to_read.append(path)
+        else:
+            term_counts[name] = previous.lesson_counts(name)
+
+    if to_read:
+        if log:
+            log(f"Tokenizing {len(to_read)} new or changed lessons ({len(names) - len(to_read)} reused)")
+        failed = set()
+
+        def on_error(path, error):
+            failed.add(path)
+            if log:
+                log(f"Skipping {Path(path).name}: {error}")
+
+        for record in iter_lesson_pages(to_read, max_workers=workers, on_error=on_error):
+            term_counts.setdefault(Path(record.lesson).name, Counter()).update(tokenize(record.text))
+        for path in to_read:
+            name = Path(path).name
+            if path in failed:
+                term_counts.pop(name, None)
+                stamps.pop(name)
+            else:
+                term_counts.setdefault(name, Counter())  # A lesson without text still gets a column
+
+    lesson_names = [name for name in names if name in term_counts]
+    vocabulary = np.array(sorted({term for counts in term_counts.values() for term in counts}), dtype=str)
+    term_ids = {term: i for i, term in enumerate(vocabulary.tolist())}
+    indptr = [0]
+    indices = []
+    counts = []
+    for name in lesson_names:
+        for term, count in sorted(term_counts[name].items()):
+            indices.append(term_ids[term])
+            counts.append(count)
+        indptr.append(len(indices))
+    return RelevanceIndex(
+        lesson_names, {name: stamps[name] for name in lesson_names}, vocabulary,
+        np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32), np.array(counts, dtype=np.int32),
+    )
+
+
+def get_relevance(lessons_dir=LESSONS_DIR):
+    """Return the process-wide RelevanceIndex, or None until lesson_relevance.py has been run.
+
+    When lessons changed since the saved index, up to RELEVANCE_INLINE_REBUILD
+    of them are re-read here and the index is saved again; beyond that the
+    saved index is used as is and its stale_lessons count is set.
+    """
+    key = str(lessons_dir)
+    signature = directory_signature(lessons_dir)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        index = cached[1] if cached is not None else RelevanceIndex.load()
+        if index is None:
+            return None
+        changed = changed_lessons(index, lessons_dir, signature)
+        removed = set(index.lesson_names) - set(signature)
+        inline_limit = int(os.environ.get("RELEVANCE_INLINE_REBUILD", DEFAULT_RELEVANCE_INLINE_REBUILD))
+        if changed or removed:
+            if len(changed) <= inline_limit:
+                index = build_index(lessons_dir, previous=index)
+                index.save()
+            else:
+                index.stale_lessons = len(changed)
+        elif index.standards_key != standards_digest(index.standard_ids):
+            index = build_index(lessons_dir, previous=index)  # MATH_STANDARDS changed; counts are reused
+            index.save()
+        _indexes[key] = (signature, index)
+        return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the standard x lesson TF-IDF relevance matrix.")
+    parser.add_argument("--lessons", default=str(LESSONS_DIR), help="directory of lesson PDFs (default: lessons/)")
+    parser.add_argument("--workers", type=int, help="extraction processes (default: EXTRACTION_WORKERS or CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-read every lesson instead of reusing stored counts")
+    parser.add_argument("--show", nargs="*", default=[], metavar="STANDARD",
+                        help="print the suggested lessons for these standard IDs or prefixes")
+    parser.add_argument("--top", type=int, help=f"lessons to show (default: SUGGESTED_LESSONS or {DEFAULT_SUGGESTED_LESSONS})")
+    args = parser.parse_args(argv)
+
+    previous = None if args.force else RelevanceIndex.load()
+    index = build_index(args.lessons, previous=previous, workers=args.workers, log=print)
+    if not index.lesson_names:
+        print(f"No lessons found in {args.lessons}", file=sys.stderr)
+        return 1
+    index.save()
+    print(f"{index.matrix.shape[0]} standards x {index.matrix.shape[1]} lessons, "
+          f"{len(index.vocabulary)} terms; saved {os.path.relpath(relevance_path())}")
+    for reference in args.show:
+        standard_ids = STANDARDS_INDEX.lookup(reference)
+        print()
+        print(f"{reference}:")
+        for name, score in index.suggest(standard_ids, args.top):
+            print(f"  {name}  {score:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
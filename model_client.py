@@ -0,0 +1,170 @@
+# One process-wide model client: request/token rate limits and retries with backoff around a provider
+
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+
+from lesson_analysis import estimate_tokens
+from model_providers import create_provider, provider_name
+
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_MAX_RETRIES = 5
+
+# Backoff before retry n is uniform in [0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**n)]
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# How often a waiting request reports its queue position
+WAIT_REPORT_SECONDS = 0.5
+
+
+class TokenBucket:
+    """Continuously refilled bucket of `per_minute` units.
+
+    reserve() takes units immediately, letting the balance go negative, and
+    returns how long the caller must wait before using them. Callers are
+    therefore served in the order they reserved, and a request larger than
+    the whole bucket still goes through after a proportional wait.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.balance = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self.balance = min(self.capacity, self.balance + (now - self.updated) * self.rate)
+            self.updated = now
+            self.balance -= amount
+            return max(0.0, -self.balance / self.rate)
+
+
+def backoff_seconds(attempt):
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class ModelClient:
+    """Rate-limited, retrying access to a model provider (see model_providers).
+
+    Errors in the provider's retryable_errors are retried with backoff.
+    on_wait(position, seconds) callbacks are called while a request is held
+    back by the limiter, with its 1-based place among waiting requests.
+    """
+
+    def __init__(self, provider, requests_per_minute=None, tokens_per_minute=None, max_retries=None):
+        if requests_per_minute is None:
+            requests_per_minute = int(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE))
+        if tokens_per_minute is None:
+            tokens_per_minute = int(os.environ.get("GEMINI_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE))
+        if max_retries is None:
+            max_retries = int(os.environ.get("GEMINI_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        self.provider = provider
+        self.model_name = provider.model_name
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self._tickets = itertools.count()
+        self._waiting = []  # Tickets of requests held back by the limiter, in arrival order
+        self._waiting_lock = threading.Lock()
+
+    def _reserve(self, prompt):
+        """Reserve limiter capacity for one request; returns (ticket, seconds to wait)."""
+        delay = max(self.request_bucket.reserve(1), self.token_bucket.reserve(estimate_tokens(prompt)))
+        ticket = next(self._tickets)
+        if delay > 0:
+            with self._waiting_lock:
+                self._waiting.append(ticket)
+        return ticket, delay
+
+    def _position(self, ticket):
+        with self._waiting_lock:
+            return self._waiting.index(ticket) + 1
+
+    def _done_waiting(self, ticket):
+        with self._waiting_lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+    def _wait_slices(self, ticket, delay, on_wait):
+        """Yield the sleeps making up a limiter wait, reporting the queue position before each."""
+        deadline = time.monotonic() + delay
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if on_wait is not None:
+                    on_wait(self._position(ticket), remaining)
+                yield min(remaining, WAIT_REPORT_SECONDS)
+        finally:
+            self._done_waiting(ticket)
+
+    def _throttle(self, prompt, on_wait):
+        ticket, delay = self._reserve(prompt)
+        for seconds in self._wait_slices(ticket, delay, on_wait):
+            time.sleep(seconds)
+
+    async def _throttle_async(self, prompt, on_wait):
+        ticket, delay = self._reserve(prompt)
+        for seconds in self._wait_slices(ticket, delay, on_wait):
+            await asyncio.sleep(seconds)
+
+    def generate_text(self, prompt, on_chunk=None, on_wait=None):
+        """Run one request and return its text.
+
+        With on_chunk, the response is streamed and on_chunk(text so far) is
+        called as chunks arrive. Retryable errors are retried with backoff
+        unless part of a streamed response was already delivered.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._throttle(prompt, on_wait)
+            delivered = False
+            try:
+                if on_chunk is None:
+                    return self.provider.generate(prompt)
+                text = ""
+                for chunk in self.provider.stream(prompt):
+                    text += chunk
+                    delivered = True
+                    on_chunk(text)
+                return text
+            except self.provider.retryable_errors:
+                if delivered or attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_seconds(attempt))
+
+    async def generate_text_async(self, prompt, on_wait=None):
+        """Run one request without blocking the event loop; retries like generate_text."""
+        for attempt in range(self.max_retries + 1):
+            await self._throttle_async(prompt, on_wait)
+            try:
+                return await self.provider.generate_async(prompt)
+            except self.provider.retryable_errors:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt))
+
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def get_client(api_key=None):
+    """Return the process-wide client for LLM_PROVIDER, creating it on first use
+    (or when the provider or API key changes)."""
+    global _client, _client_key
+    key = (provider_name(), api_key)
+    with _client_lock:
+        if _client is None or _client_key != key:
+            _client = ModelClient(create_provider(key[0], api_key))
+            _client_key = key
+        return _client
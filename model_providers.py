@@ -0,0 +1,239 @@
+# Backends that answer model prompts: Gemini, a deterministic local stub, and record/replay
+#
+# LLM_PROVIDER selects the backend:
+#   gemini  - the live Gemini API (default)
+#   stub    - canned responses with configurable latency and token throughput
+#   record  - the live API, saving every interaction to LLM_RECORDINGS_DIR
+#   replay  - answers from LLM_RECORDINGS_DIR only, no network access
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+from lesson_analysis import CHARS_PER_TOKEN, GENERATION_CONFIG, MODEL_NAME
+from text_cache import cache_root, write_atomic
+
+DEFAULT_PROVIDER = "gemini"
+DEFAULT_STUB_LATENCY_SECONDS = 0.5
+DEFAULT_STUB_TOKENS_PER_SECOND = 200
+# Tokens per chunk when the stub streams a response
+STUB_CHUNK_TOKENS = 8
+
+STUB_RESPONSE = """## Coverage Analysis
+- Requirement 1: ✔ Met — Stub response; no model was called.
+- Requirement 2: ◑ Partially Met — Stub response; no model was called.
+- Requirement 3: ✗ Not Met — Stub response; no model was called.
+
+## Missing Elements
+- None (stub response).
+
+## Redundancies
+- None (stub response).
+"""
+
+
+class Provider:
+    """Base class for model backends.
+
+    stream(prompt) yields the response text in chunks; generate() and
+    generate_async() return the whole text. retryable_errors lists the
+    exceptions the client should retry with backoff.
+    """
+
+    name = None
+    model_name = None
+    retryable_errors = ()
+
+    def stream(self, prompt):
+        raise NotImplementedError
+
+    def generate(self, prompt):
+        return "".join(self.stream(prompt))
+
+    async def generate_async(self, prompt):
+        return await asyncio.to_thread(self.generate, prompt)
+
+
+class GeminiProvider(Provider):
+    """The live Gemini API. genai.configure runs once per provider."""
+
+    name = "gemini"
+    # Quota rejections and transient server errors
+    retryable_errors = (
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+    )
+
+    def __init__(self, api_key, model_name=MODEL_NAME):
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.generation_config = genai.GenerationConfig(**GENERATION_CONFIG)
+
+    def stream(self, prompt):
+        response = self.model.generate_content(prompt, generation_config=self.generation_config, stream=True)
+        for chunk in response:
+            if chunk.parts:  # Skip e.g. the final chunk that only carries the finish reason
+                yield chunk.text
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt, generation_config=self.generation_config).text
+
+    # generate_async stays on the base class (the sync call in a worker thread): genai's
+    # grpc.aio client is created once per configure() and bound to the event loop it first
+    # ran on, so awaiting generate_content_async from a later asyncio.run() fails with
+    # "Event loop is closed".
+
+
+class StubProvider(Provider):
+    """Deterministic local backend for benchmarks and load tests.
+
+    Waits latency_seconds before the first chunk, then produces the canned
+    response at tokens_per_second. The response is read from
+    STUB_RESPONSE_FILE when set, otherwise STUB_RESPONSE is used.
+    """
+
+    name = "stub"
+    model_name = "stub"
+
+    def __init__(self, latency_seconds=None, tokens_per_second=None, response=None):
+        if latency_seconds is None:
+            latency_seconds = float(os.environ.get("STUB_LATENCY_SECONDS", DEFAULT_STUB_LATENCY_SECONDS))
+        if tokens_per_second is None:
+            tokens_per_second = float(os.environ.get("STUB_TOKENS_PER_SECOND", DEFAULT_STUB_TOKENS_PER_SECOND))
+        if response is None:
+            response_file = os.environ.get("STUB_RESPONSE_FILE")
+            response = Path(response_file).read_text(encoding="utf-8") if response_file else STUB_RESPONSE
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.response = response
+
+    def _chunks(self):
+        size = STUB_CHUNK_TOKENS * CHARS_PER_TOKEN
+        return [self.response[i:i + size] for i in range(0, len(self.response), size)]
+
+    def _chunk_seconds(self, chunk):
+        return len(chunk) / CHARS_PER_TOKEN / self.tokens_per_second if self.tokens_per_second else 0
+
+    def stream(self, prompt):
+        time.sleep(self.latency_seconds)
+        for chunk in self._chunks():
+            time.sleep(self._chunk_seconds(chunk))
+            yield chunk
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.latency_seconds + self._chunk_seconds(self.response))
+        return self.response
+
+
+def prompt_digest(model_name, prompt):
+    """Key of a recorded interaction."""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def recordings_dir():
+    return Path(os.environ.get("LLM_RECORDINGS_DIR", cache_root() / "recordings"))
+
+
+class RecordingProvider(Provider):
+    """Passes requests to another provider and saves each completed interaction."""
+
+    name = "record"
+
+    def __init__(self, inner, root=None):
+        self.inner = inner
+        self.model_name = inner.model_name
+        self.retryable_errors = inner.retryable_errors
+        self.root = Path(root or recordings_dir())
+
+    def _save(self, prompt, chunks):
+        digest = prompt_digest(self.model_name, prompt)
+        record = {
+            "model": self.model_name,
+            "prompt_sha256": digest,
+            "recorded_at": time.time(),
+            "prompt": prompt,
+            "chunks": chunks,
+        }
+        write_atomic(self.root / f"{digest}.json", json.dumps(record).encode("utf-8"))
+
+    def stream(self, prompt):
+        chunks = []
+        for chunk in self.inner.stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        self._save(prompt, chunks)
+
+    def generate(self, prompt):
+        text = self.inner.generate(prompt)
+        self._save(prompt, [text])
+        return text
+
+    async def generate_async(self, prompt):
+        text = await self.inner.generate_async(prompt)
+        self._save(prompt, [text])
+        return text
+
+
+class ReplayMissing(LookupError):
+    """Raised when replaying a prompt that was never recorded."""
+
+
+class ReplayProvider(Provider):
+    """Serves recorded interactions offline, chunk for chunk."""
+
+    name = "replay"
+
+    def __init__(self, root=None, model_name=MODEL_NAME):
+        self.root = Path(root or recordings_dir())
+        self.model_name = model_name
+
+    def _chunks(self, prompt):
+        digest = prompt_digest(self.model_name, prompt)
+        try:
+            with open(self.root / f"{digest}.json", "r", encoding="utf-8") as f:
+                return json.load(f)["chunks"]
+        except FileNotFoundError:
+            raise ReplayMissing(f"No recording for prompt {digest[:12]} in {self.root}") from None
+
+    def stream(self, prompt):
+        yield from self._chunks(prompt)
+
+    async def generate_async(self, prompt):
+        return "".join(self._chunks(prompt))
+
+
+def provider_name():
+    return os.environ.get("LLM_PROVIDER", DEFAULT_PROVIDER).lower()
+
+
+def requires_api_key(name=None):
+    """True when the provider calls the live API."""
+    return (name or provider_name()) in ("gemini", "record")
+
+
+def provider_model_name(name=None):
+    """Model name a provider answers as, without creating it (part of the analysis cache key)."""
+    return StubProvider.model_name if (name or provider_name()) == "stub" else MODEL_NAME
+
+
+def create_provider(name=None, api_key=None):
+    name = name or provider_name()
+    if name == "gemini":
+        return GeminiProvider(api_key)
+    if name == "stub":
+        return StubProvider()
+    if name == "record":
+        return RecordingProvider(GeminiProvider(api_key))
+    if name == "replay":
+        return ReplayProvider()
+    raise ValueError(f"Unknown LLM_PROVIDER {name!r}; expected gemini, stub, record or replay")
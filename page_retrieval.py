@@ -0,0 +1,127 @@
+# Local BM25 ranking of lesson pages against a standard, for "focused" analysis
+
+import math
+import os
+import re
+from collections import Counter
+
+from lesson_analysis import CHARS_PER_TOKEN
+from standards_index import STANDARDS_INDEX
+
+# Prompt tokens allowed for lesson pages in focused mode (FOCUSED_TOKEN_BUDGET, read when used)
+DEFAULT_FOCUSED_TOKEN_BUDGET = 30_000
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from has have in is it its of on or that the their them
+    they this to use using was were which will with within you your include includes including
+""".split())
+
+
+def tokenize(text):
+    """Lower-case word tokens without stopwords or single characters."""
+    return [word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def standard_query_text(standards_text):
+    """Text to rank pages against: the full MATH_STANDARDS entries for any IDs
+    found in the standards input, or the input itself when none are recognised."""
+    parts = []
+    for standard_id in STANDARDS_INDEX.find_ids(standards_text):
+        standard = STANDARDS_INDEX.get(standard_id)
+        parts.append(standard["description"])
+        parts.extend(standard["clarifications"])
+        parts.extend(standard["examples"])
+    return "\n".join(parts) if parts else standards_text
+
+
+class BM25Index:
+    """Okapi BM25 over a list of tokenized documents (here, lesson pages)."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query_tokens):
+        """BM25 score of every document for the query, in document order."""
+        query_terms = Counter(query_tokens)
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            score = 0.0
+            for term, query_frequency in query_terms.items():
+                frequency = counts.get(term)
+                if frequency:
+                    score += query_frequency * self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+
+def select_focused_pages(lesson_pages, query_text, token_budget=None):
+    """Pick the pages most relevant to query_text within a token budget.
+
+    lesson_pages is a list of (name, [page text, ...]). One page of every
+    lesson is always kept so no lesson's evidence is dropped outright: its best
+    matching page, or its first page when none of its pages match. The
+    remaining budget is filled in overall rank order, then with the following
+    pages of lessons that had no match. Returns (name, [(page number, text),
+    ...]) for lessons with at least one page, in the original lesson and page
+    order, or None when no page matches the query at all.
+    """
+    token_budget = token_budget or int(os.environ.get("FOCUSED_TOKEN_BUDGET", DEFAULT_FOCUSED_TOKEN_BUDGET))
+    max_chars = token_budget * CHARS_PER_TOKEN
+    locations = [
+        (lesson_index, page_index)
+        for lesson_index, (_, pages) in enumerate(lesson_pages)
+        for page_index in range(len(pages))
+    ]
+    documents = [tokenize(lesson_pages[lesson][1][page]) for lesson, page in locations]
+    scores = BM25Index(documents).scores(tokenize(query_text))
+    ranked = sorted(
+        (position for position in range(len(locations)) if scores[position] > 0),
+        key=lambda position: -scores[position],
+    )
+    if not ranked:
+        return None
+
+    # Positions follow lesson then page order, so a lesson's first page comes first
+    keep_per_lesson = {}
+    for position in ranked:
+        keep_per_lesson.setdefault(locations[position][0], position)
+    unmatched = [position for position in range(len(locations)) if locations[position][0] not in keep_per_lesson]
+    for position in unmatched:
+        keep_per_lesson.setdefault(locations[position][0], position)
+
+    selected = set(keep_per_lesson.values())
+    used_chars = sum(len(lesson_pages[lesson][1][page]) for lesson, page in map(locations.__getitem__, selected))
+    for position in ranked + unmatched:
+        if position in selected:
+            continue
+        lesson, page = locations[position]
+        page_chars = len(lesson_pages[lesson][1][page])
+        if used_chars + page_chars > max_chars:
+            continue
+        selected.add(position)
+        used_chars += page_chars
+
+    focused = {}
+    for position in sorted(selected):
+        lesson, page = locations[position]
+        focused.setdefault(lesson, []).append((page + 1, lesson_pages[lesson][1][page]))
+    return [(lesson_pages[lesson][0], pages) for lesson, pages in focused.items()]
+
+
+def format_focused_pages(pages):
+    """Render selected (page number, text) pairs as lesson text with page markers."""
+    return "".join(f"[Page {number}]\n{text}\n" for number, text in pages)
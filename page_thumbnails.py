@@ -0,0 +1,129 @@
+# Low-DPI page thumbnails rendered on demand with PyMuPDF, cached in memory and on disk
+
+import os
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+
+from corpus_bundle import get_bundle
+from lesson_catalog import on_lesson_change
+from text_cache import cache_root, evict_lru, file_digest, write_atomic
+
+THUMBNAIL_DPI = 48
+DEFAULT_THUMBNAIL_MEMORY_ITEMS = 512
+DEFAULT_THUMBNAIL_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """PNG thumbnails keyed by (file digest, page, DPI).
+
+    A bounded in-memory LRU sits in front of an on-disk store that is itself
+    trimmed least-recently-used to max_bytes.
+    """
+
+    def __init__(self, root=None, memory_items=None, max_bytes=None):
+        if root is None:
+            root = cache_root() / "thumbnails"
+        if memory_items is None:
+            memory_items = int(os.environ.get("THUMBNAIL_MEMORY_ITEMS", DEFAULT_THUMBNAIL_MEMORY_ITEMS))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", DEFAULT_THUMBNAIL_CACHE_MAX_BYTES))
+        self.root = root
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        digest, page_number, dpi = key
+        return self.root / digest[:2] / f"{digest}-{page_number}-{dpi}.png"
+
+    def get(self, key):
+        with self._lock:
+            png = self._memory.get(key)
+            if png is not None:
+                self._memory.move_to_end(key)
+                return png
+        path = self._entry_path(key)
+        try:
+            png = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        write_atomic(self._entry_path(key), png)
+        self._remember(key, png)
+        evict_lru(self.root.glob("*/*.png"), self.max_bytes)
+
+    def purge(self, digest):
+        """Drop every thumbnail of a file digest, in memory and on disk."""
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == digest]:
+                del self._memory[key]
+        for path in self.root.glob(f"{digest[:2]}/{digest}-*.png"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+
+# Created on first use, so cache settings from .env apply
+_thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    """Return the process-wide thumbnail cache."""
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache()
+    return _thumbnail_cache
+
+# Page counts by file digest, so paging through a lesson does not reopen it
+_page_counts = {}
+
+
+def page_count(file_path):
+    """Number of pages in a lesson PDF."""
+    digest = file_digest(file_path)
+    count = _page_counts.get(digest)
+    if count is None:
+        bundle = get_bundle()
+        count = bundle.page_count(file_path) if bundle else None
+        if count is None:
+            with fitz.open(file_path) as doc:
+                count = doc.page_count
+        _page_counts[digest] = count
+    return count
+
+
+def render_thumbnail(file_path, page_number, dpi=THUMBNAIL_DPI):
+    """Return a PNG of one page (0-based page_number), rendering it only on a cache miss."""
+    key = (file_digest(file_path), page_number, dpi)
+    png = get_thumbnail_cache().get(key)
+    if png is None:
+        with fitz.open(file_path) as doc:
+            png = doc[page_number].get_pixmap(dpi=dpi).tobytes("png")
+        get_thumbnail_cache().put(key, png)
+    return png
+
+
+@on_lesson_change
+def _purge_changed_lesson(file_path, old_digests):
+    """Drop thumbnails and the page count of a lesson's previous contents."""
+    for digest in old_digests:
+        get_thumbnail_cache().purge(digest)
+        _page_counts.pop(digest, None)
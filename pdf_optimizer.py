@@ -0,0 +1,205 @@
+# Offline pass that rewrites lesson PDFs into smaller optimized copies, with a size/speed report
+#
+#   python pdf_optimizer.py                      # optimize every lesson, report sizes and timings
+#   python pdf_optimizer.py --limit 10 --report optimize.json
+#
+# Each lesson is saved through PyMuPDF with unused objects removed, identical
+# objects (shared images, fonts) merged, content streams cleaned and every
+# stream deflated, and small objects packed into object streams. Copies are
+# stored by content digest under .cache/optimized and are served by the app's
+# PDF viewer in place of the plain processed copy.
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from extraction_backends import _word_overlap, get_backend
+from lesson_catalog import on_lesson_change
+from text_cache import cache_root, file_digest, write_atomic
+
+# Bump when OPTIMIZE_OPTIONS change, so older copies are rebuilt
+OPTIMIZER_VERSION = 1
+
+# garbage=4 also merges duplicate objects, which is what deduplicates shared images and fonts
+OPTIMIZE_OPTIONS = {
+    "garbage": 4,
+    "clean": True,
+    "deflate": True,
+    "deflate_images": True,
+    "deflate_fonts": True,
+    "use_objstms": 1,
+}
+
+
+def optimized_cache_dir():
+    return cache_root() / "optimized"
+
+
+def _optimized_path(digest, root=None):
+    return (root or optimized_cache_dir()) / digest[:2] / f"{digest}-o{OPTIMIZER_VERSION}.pdf"
+
+
+def optimized_pdf(file_path):
+    """Return the path of the optimized copy of a lesson, or None if the pass has not produced one."""
+    path = _optimized_path(file_digest(file_path))
+    return str(path) if path.exists() else None
+
+
+def optimize_pdf(file_path, root=None, force=False):
+    """Write the optimized copy of a PDF (never larger than the original); returns its path."""
+    path = _optimized_path(file_digest(file_path), root)
+    if path.exists() and not force:
+        return path
+    with fitz.open(file_path) as doc:
+        data = doc.tobytes(**OPTIMIZE_OPTIONS)
+    if len(data) >= os.path.getsize(file_path):
+        data = Path(file_path).read_bytes()
+    write_atomic(path, data)
+    return path
+
+
+def _time(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _encode_for_display(path):
+    """What display_pdf does without static serving: read and base64 the file."""
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+def _optimize_lesson(file_path, root, force, measure, backend_name):
+    """Optimize one lesson and, when measure is set, time extraction and display before and after."""
+    optimized_path, optimize_seconds = _time(optimize_pdf, file_path, root, force)
+    row = {
+        "file": Path(file_path).name,
+        "original_bytes": os.path.getsize(file_path),
+        "optimized_bytes": optimized_path.stat().st_size,
+        "optimize_seconds": optimize_seconds,
+    }
+    if measure:
+        # The app displays the plain processed copy (doc.tobytes()) when there is no optimized one
+        with fitz.open(file_path) as doc:
+            processed = doc.tobytes()
+        row["processed_bytes"] = len(processed)
+        backend = get_backend(file_path, backend_name)
+        original_pages, row["extract_original_seconds"] = _time(backend.extract_pages, file_path)
+        optimized_pages, row["extract_optimized_seconds"] = _time(backend.extract_pages, str(optimized_path))
+        row["text_overlap"] = _word_overlap("\n".join(original_pages), "\n".join(optimized_pages))
+        _, row["display_processed_seconds"] = _time(lambda: base64.b64encode(processed).decode("utf-8"))
+        _, row["display_optimized_seconds"] = _time(_encode_for_display, optimized_path)
+    return row
+
+
+def optimize_corpus(file_paths, root=None, workers=None, force=False, measure=True, backend_name=None, log=print):
+    """Optimize lessons on a process pool; returns one report row per file (failures carry "error")."""
+    workers = workers or os.cpu_count() or 1
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(_optimize_lesson, path, root, force, measure, backend_name): path for path in file_paths
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                row = future.result()
+                saved = 1 - row["optimized_bytes"] / row["original_bytes"]
+                log(f"[{done}/{len(file_paths)}] {row['file']}: {row['original_bytes'] / 1e6:.2f} MB -> "
+                    f"{row['optimized_bytes'] / 1e6:.2f} MB ({saved:.0%} smaller)")
+            except Exception as e:
+                row = {"file": Path(path).name, "error": str(e)}
+                log(f"[{done}/{len(file_paths)}] {row['file']} FAILED: {e}")
+            rows.append(row)
+    return sorted(rows, key=lambda row: row["file"])
+
+
+def summarize(rows):
+    """Corpus totals: bytes before/after and the extraction and display speedups."""
+    ok = [row for row in rows if "error" not in row]
+    summary = {
+        "files": len(rows),
+        "failed": len(rows) - len(ok),
+        "original_bytes": sum(row["original_bytes"] for row in ok),
+        "optimized_bytes": sum(row["optimized_bytes"] for row in ok),
+    }
+    summary["size_reduction"] = 1 - summary["optimized_bytes"] / max(summary["original_bytes"], 1)
+    measured = [row for row in ok if "extract_original_seconds" in row]
+    if measured:
+        def speedup(before, after):
+            after_total = sum(row[after] for row in measured)
+            return sum(row[before] for row in measured) / after_total if after_total else None
+
+        summary["extraction_speedup"] = speedup("extract_original_seconds", "extract_optimized_seconds")
+        summary["display_speedup"] = speedup("display_processed_seconds", "display_optimized_seconds")
+        summary["display_bytes_reduction"] = 1 - (
+            sum(row["optimized_bytes"] for row in measured) / max(sum(row["processed_bytes"] for row in measured), 1)
+        )
+        summary["min_text_overlap"] = min(row["text_overlap"] for row in measured)
+    return summary
+
+
+def _print_summary(summary, backend_name):
+    print()
+    print(f"{summary['files']} files, {summary['failed']} failed: "
+          f"{summary['original_bytes'] / 1e6:.1f} MB -> {summary['optimized_bytes'] / 1e6:.1f} MB "
+          f"({summary['size_reduction']:.1%} smaller)")
+    if "extraction_speedup" in summary:
+        print(f"extraction ({backend_name}): {summary['extraction_speedup']:.2f}x, "
+              f"text overlap min {summary['min_text_overlap']:.1%}")
+        print(f"display: {summary['display_bytes_reduction']:.1%} fewer bytes sent, "
+              f"base64 encoding {summary['display_speedup']:.2f}x")
+
+
+@on_lesson_change
+def _purge_changed_lesson(file_path, old_digests):
+    """Delete optimized copies of a lesson's previous contents."""
+    for digest in old_digests:
+        for path in optimized_cache_dir().glob(f"{digest[:2]}/{digest}-o*.pdf"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write optimized copies of lesson PDFs and report the savings.")
+    parser.add_argument("--lessons", default=str(Path(__file__).parent / "lessons"),
+                        help="directory of lesson PDFs (default: lessons/)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--limit", type=int, help="only optimize the first N files")
+    parser.add_argument("--force", action="store_true", help="rebuild copies that already exist")
+    parser.add_argument("--no-measure", action="store_true", help="skip the extraction and display timings")
+    parser.add_argument("--backend", help="extraction backend to time (default: PDF_BACKEND or pypdf2)")
+    parser.add_argument("--report", metavar="PATH", help="also write per-file rows and totals to a JSON file")
+    args = parser.parse_args(argv)
+
+    file_paths = sorted(str(path) for path in Path(args.lessons).glob("*.pdf"))
+    if args.limit:
+        file_paths = file_paths[:args.limit]
+    if not file_paths:
+        print(f"No PDFs found in {args.lessons}", file=sys.stderr)
+        return 1
+
+    rows = optimize_corpus(file_paths, workers=args.workers, force=args.force, measure=not args.no_measure,
+                           backend_name=args.backend)
+    summary = summarize(rows)
+    backend_name = args.backend or os.environ.get("PDF_BACKEND", "pypdf2")
+    _print_summary(summary, backend_name)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"options": OPTIMIZE_OPTIONS, "summary": summary, "files": rows}, f, indent=2)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# Publishing processed lesson PDFs through Streamlit's static file serving
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from lesson_catalog import on_lesson_change
+
+# Streamlit serves <app dir>/static/ at app/static/ when server.enableStaticServing is on
+STATIC_DIR = Path(__file__).parent / "static"
+SERVED_PDF_DIR = STATIC_DIR / "lessons"
+SERVED_PDF_URL = "app/static/lessons"
+
+
+def publish_pdf(processed_path):
+    """Make a processed PDF available under static/ and return its URL.
+
+    Processed PDFs are named by content digest, so the URL is stable for a
+    given file and changes whenever the lesson does. The file is hard-linked
+    where possible (no copy), falling back to a copy across filesystems.
+    """
+    processed_path = Path(processed_path)
+    served_path = SERVED_PDF_DIR / processed_path.name
+    if not served_path.exists():
+        SERVED_PDF_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SERVED_PDF_DIR, suffix=".tmp")
+        os.close(fd)
+        try:
+            os.unlink(tmp_path)
+            try:
+                os.link(processed_path, tmp_path)
+            except OSError:
+                shutil.copyfile(processed_path, tmp_path)
+            os.replace(tmp_path, served_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+    return f"{SERVED_PDF_URL}/{served_path.name}"
+
+
+@on_lesson_change
+def _unpublish_changed_lesson(file_path, old_digests):
+    """Stop serving copies of a lesson's previous contents."""
+    for digest in old_digests:
+        # Processed copies are "<digest>.pdf", optimized ones "<digest>-o<version>.pdf"
+        for served_path in SERVED_PDF_DIR.glob(f"{digest}*.pdf"):
+            try:
+                served_path.unlink()
+            except FileNotFoundError:
+                pass
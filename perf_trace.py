@@ -0,0 +1,158 @@
+# Per-stage timings of Generate Analysis, exported as a JSON-lines log and Prometheus text metrics
+#
+# Every finished trace is appended to PERF_LOG_PATH (default
+# .cache/perf/analysis_traces.jsonl; "off" disables it). When
+# PROMETHEUS_TEXTFILE is set, summaries with p50/p95 over the last
+# PERF_WINDOW traces are rewritten there after each analysis, in the text
+# format read by node_exporter's textfile collector.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from text_cache import cache_root, write_atomic
+
+# Stage names, in flow order, with their display labels
+STAGES = {
+    "extraction": "Extraction",
+    "prompt_build": "Prompt build",
+    "model_call": "Model call",
+    "pdf_embed": "PDF embed",
+}
+DEFAULT_PERF_WINDOW = 1000
+QUANTILES = (0.5, 0.95)
+
+
+class AnalysisTrace:
+    """Timing spans and attributes (prompt size, tokens, cache result) of one analysis."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.spans = {}
+        self.attributes = {}
+
+    @contextmanager
+    def span(self, name):
+        """Time a block; repeated spans with the same name add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_record(self):
+        return {"started_at": self.started_at, "spans": dict(self.spans), **self.attributes}
+
+
+def quantile(ordered, q):
+    """Nearest-rank quantile of a sorted list."""
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TraceMetrics:
+    """Process-wide aggregates of finished traces."""
+
+    def __init__(self, window=None):
+        window = window or int(os.environ.get("PERF_WINDOW", DEFAULT_PERF_WINDOW))
+        self.stage_samples = {}   # stage -> recent durations
+        self.stage_totals = {}    # stage -> [sum, count] since process start
+        self.prompt_tokens = deque(maxlen=window)
+        self.prompt_tokens_total = [0, 0]
+        self.cache_results = {}
+        self.boilerplate_tokens_saved = 0
+        self.window = window
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        with self._lock:
+            for stage, seconds in trace.spans.items():
+                self.stage_samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+                totals = self.stage_totals.setdefault(stage, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+            tokens = trace.attributes.get("prompt_tokens")
+            if tokens is not None:
+                self.prompt_tokens.append(tokens)
+                self.prompt_tokens_total[0] += tokens
+                self.prompt_tokens_total[1] += 1
+            self.boilerplate_tokens_saved += trace.attributes.get("boilerplate_tokens_saved", 0)
+            cache = trace.attributes.get("cache")
+            if cache is not None:
+                self.cache_results[cache] = self.cache_results.get(cache, 0) + 1
+
+    def stage_percentiles(self):
+        """{stage: (p50, p95, samples)} over the recent window."""
+        with self._lock:
+            result = {}
+            for stage, samples in self.stage_samples.items():
+                ordered = sorted(samples)
+                result[stage] = (quantile(ordered, 0.5), quantile(ordered, 0.95), len(ordered))
+            return result
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP lesson_analysis_stage_seconds Time spent in each stage of Generate Analysis.",
+                "# TYPE lesson_analysis_stage_seconds summary",
+            ]
+            for stage, samples in self.stage_samples.items():
+                ordered = sorted(samples)
+                for q in QUANTILES:
+                    lines.append(f'lesson_analysis_stage_seconds{{stage="{stage}",quantile="{q}"}} {quantile(ordered, q):.6f}')
+                total, count = self.stage_totals[stage]
+                lines.append(f'lesson_analysis_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'lesson_analysis_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines += [
+                "# HELP lesson_analysis_prompt_tokens Estimated prompt tokens per analysis.",
+                "# TYPE lesson_analysis_prompt_tokens summary",
+            ]
+            if self.prompt_tokens:
+                ordered = sorted(self.prompt_tokens)
+                for q in QUANTILES:
+                    lines.append(f'lesson_analysis_prompt_tokens{{quantile="{q}"}} {quantile(ordered, q)}')
+            lines.append(f"lesson_analysis_prompt_tokens_sum {self.prompt_tokens_total[0]}")
+            lines.append(f"lesson_analysis_prompt_tokens_count {self.prompt_tokens_total[1]}")
+            lines += [
+                "# HELP lesson_analysis_cache_total Analyses by analysis cache result.",
+                "# TYPE lesson_analysis_cache_total counter",
+            ]
+            for result, count in self.cache_results.items():
+                lines.append(f'lesson_analysis_cache_total{{result="{result}"}} {count}')
+            lines += [
+                "# HELP lesson_analysis_boilerplate_tokens_saved_total Estimated lesson tokens removed as boilerplate.",
+                "# TYPE lesson_analysis_boilerplate_tokens_saved_total counter",
+                f"lesson_analysis_boilerplate_tokens_saved_total {self.boilerplate_tokens_saved}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+trace_metrics = TraceMetrics()
+
+
+def perf_log_path():
+    path = os.environ.get("PERF_LOG_PATH", str(cache_root() / "perf" / "analysis_traces.jsonl"))
+    return None if path.lower() == "off" else Path(path)
+
+
+_log_lock = threading.Lock()
+
+
+def record_trace(trace):
+    """Add a finished trace to the process metrics and export it."""
+    trace_metrics.add(trace)
+    log_path = perf_log_path()
+    if log_path is not None:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with _log_lock, open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_record()) + "\n")
+    textfile = os.environ.get("PROMETHEUS_TEXTFILE")
+    if textfile:
+        write_atomic(Path(textfile), trace_metrics.prometheus_text().encode("utf-8"))
@@ -0,0 +1,46 @@
+# Processed (re-saved through PyMuPDF) copies of lesson PDFs, stored once per content digest
+
+import threading
+
+import fitz  # PyMuPDF
+
+from lesson_catalog import on_lesson_change
+from text_cache import cache_root, file_digest, write_atomic
+
+# One lock per digest, so concurrent sessions in this process never render the
+# same file twice; across processes the atomic rename keeps the file whole.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def processed_cache_dir():
+    """Return the directory holding processed PDFs (outside lessons/)."""
+    return cache_root() / "processed"
+
+
+def _lock_for(digest):
+    with _locks_guard:
+        return _locks.setdefault(digest, threading.Lock())
+
+
+def ensure_processed_pdf(file_path, root=None):
+    """Return the path of the processed copy of a PDF, creating it on first use."""
+    digest = file_digest(file_path)
+    processed_path = (root or processed_cache_dir()) / f"{digest}.pdf"
+    if processed_path.exists():
+        return processed_path
+    with _lock_for(digest):
+        if not processed_path.exists():
+            with fitz.open(file_path) as doc:
+                write_atomic(processed_path, doc.tobytes())
+    return processed_path
+
+
+@on_lesson_change
+def _purge_changed_lesson(file_path, old_digests):
+    """Delete processed copies of a lesson's previous contents."""
+    for digest in old_digests:
+        try:
+            (processed_cache_dir() / f"{digest}.pdf").unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,307 @@
+# Grade 6-8 progression documents (data/*.docx) parsed once into a cached index of prior/following standards
+#
+# Rebuild (or inspect) the index with:
+#   python standard_progressions.py             # parse data/*.docx if they changed, print a summary
+#   python standard_progressions.py MA.7.AR.2.1 # also print the prerequisite context for a standard
+#
+# Each "6-8 <STRAND> Progression.docx" describes conceptual threads whose
+# learning progressions name benchmarks grade by grade. A standard's prior
+# standards are the thread members from the nearest earlier grade (or the
+# elementary benchmarks under the thread's "Prior Learning" when it is the
+# thread's first grade); its following standards are the members from the
+# nearest later grade. Benchmarks the documents never name inherit the
+# relations of the rest of their cluster. The index is written to
+# .cache/progressions as JSON, keyed by the documents' content digests, so the
+# app loads it at startup instead of opening any .docx file.
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+from standards_index import STANDARDS_INDEX
+from text_cache import cache_root, file_digest, write_atomic
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# Bump when parsing or the index layout changes; older index files are then ignored
+PROGRESSION_FORMAT_VERSION = 2
+
+# "6-8 AR Progression.docx" -> strand "AR"
+PROGRESSION_PATTERN = re.compile(r"6-8 ([A-Z]+) Progression\.docx")
+
+# A benchmark ID, optionally a range in the same domain ("MA.8.AR.2.1-2.2")
+STANDARD_ID_PATTERN = re.compile(r"\bMA\.(\d+)\.([A-Z]+)\.(\d+)\.(\d+)(?:\s*[-–]\s*(\d+)\.(\d+))?")
+THREAD_TITLE_PATTERN = re.compile(r"Conceptual Thread \d+:\s*(.+)")
+# "- **MA.6.AR.1.1**: description" bullets in the Concept Development section
+SUMMARY_PATTERN = re.compile(r"^\s*-\s*\*\*(MA\.\d+\.[A-Z]+\.\d+\.\d+):?\*\*:?\s*(.+)$", re.MULTILINE)
+
+MIDDLE_GRADES = (6, 7, 8)
+
+# First line of the context block appended to the standards text
+PREREQUISITE_CONTEXT_HEADER = "PREREQUISITE CONTEXT (grade 6-8 progressions):"
+
+# data dir -> (signature, ProgressionIndex)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def standard_ids_in(text):
+    """Return (standard ID, grade) pairs mentioned in text, in order; ranges are expanded."""
+    found = []
+    for match in STANDARD_ID_PATTERN.finditer(text):
+        grade, domain, cluster, benchmark, end_cluster, end_benchmark = match.groups()
+        ids = [f"MA.{grade}.{domain}.{cluster}.{benchmark}"]
+        if end_cluster == cluster and int(end_benchmark) > int(benchmark):
+            ids += [f"MA.{grade}.{domain}.{cluster}.{n}" for n in range(int(benchmark) + 1, int(end_benchmark) + 1)]
+        elif end_cluster:
+            ids.append(f"MA.{grade}.{domain}.{end_cluster}.{end_benchmark}")
+        found.extend((standard_id, int(grade)) for standard_id in ids)
+    return found
+
+
+def _sections(paragraphs):
+    """Split a document's paragraphs into {Heading 1 text: [paragraph texts]}."""
+    sections = {}
+    current = sections.setdefault("", [])
+    for paragraph in paragraphs:
+        if paragraph.style is not None and paragraph.style.name == "Heading 1":
+            current = sections.setdefault(paragraph.text.strip(), [])
+        else:
+            current.append(paragraph.text)
+    return sections
+
+
+def parse_progression(file_path):
+    """Read one progression document into its strand, threads and per-standard summaries.
+
+    Threads are dicts with a title, the grade 6-8 members in grade order and
+    the earlier-grade foundations named in the thread.
+    """
+    import docx  # python-docx; only needed when the index is rebuilt
+
+    strand = PROGRESSION_PATTERN.match(Path(file_path).name).group(1)
+    sections = _sections(docx.Document(file_path).paragraphs)
+
+    threads = []
+    for text in sections.get("Conceptual Threads", []):
+        title = THREAD_TITLE_PATTERN.search(text)
+        if title:
+            threads.append({"title": title.group(1).split("\n")[0].strip(" *#"), "members": {}, "foundations": {}})
+        if not threads:
+            continue
+        for standard_id, grade in standard_ids_in(text):
+            if grade in MIDDLE_GRADES:
+                threads[-1]["members"].setdefault(standard_id, grade)
+            elif grade < MIDDLE_GRADES[0]:
+                threads[-1]["foundations"].setdefault(standard_id, grade)
+
+    development = "\n".join(sections.get("Concept Development", []))
+    summaries = {standard_id: summary.strip() for standard_id, summary in SUMMARY_PATTERN.findall(development)}
+    # Every grade 6-8 standard the strand section describes, for standards no thread mentions
+    sequence = {
+        standard_id: grade for standard_id, grade in standard_ids_in(development) if grade in MIDDLE_GRADES
+    }
+
+    return {
+        "strand": strand,
+        "threads": [
+            {
+                "title": thread["title"],
+                "members": sorted(thread["members"].items(), key=lambda item: item[1]),
+                "foundations": list(thread["foundations"]),
+            }
+            for thread in threads
+        ],
+        "sequence": sorted(sequence.items(), key=lambda item: item[1]),
+        "summaries": summaries,
+    }
+
+
+def _neighbours(members, grade):
+    """(IDs from the nearest earlier grade, IDs from the nearest later grade) among (ID, grade) members."""
+    earlier = [g for _, g in members if g < grade]
+    later = [g for _, g in members if g > grade]
+    prior = [standard_id for standard_id, g in members if earlier and g == max(earlier)]
+    following = [standard_id for standard_id, g in members if later and g == min(later)]
+    return prior, following
+
+
+def build_index(documents):
+    """Combine parsed documents into {standard ID: entry} with strand, grade, threads, prior, following, summary."""
+    standards = {}
+
+    def entry(standard_id, grade, strand):
+        return standards.setdefault(standard_id, {
+            "strand": strand, "grade": grade, "threads": [], "prior": [], "following": [], "summary": None,
+        })
+
+    def add(target, standard_ids):
+        target.extend(standard_id for standard_id in standard_ids if standard_id not in target)
+
+    for document in documents:
+        strand = document["strand"]
+        for thread in document["threads"]:
+            members = thread["members"]
+            first_grade = members[0][1] if members else None
+            for standard_id, grade in members:
+                item = entry(standard_id, grade, strand)
+                item["threads"].append(f"{strand}: {thread['title']}")
+                prior, following = _neighbours(members, grade)
+                add(item["prior"], prior if grade != first_grade else thread["foundations"])
+                add(item["following"], following)
+        for standard_id, grade in document["sequence"]:
+            if standard_id not in standards:
+                item = entry(standard_id, grade, strand)
+                prior, following = _neighbours(document["sequence"], grade)
+                add(item["prior"], prior)
+                add(item["following"], following)
+        for standard_id, summary in document["summaries"].items():
+            if standard_id in standards and not standards[standard_id]["summary"]:
+                standards[standard_id]["summary"] = summary
+
+    # Benchmarks no document names share the progression of their cluster ("MA.7.AR.3")
+    for standard_id in STANDARDS_INDEX.standards:
+        if standard_id in standards:
+            continue
+        cluster, _, _ = standard_id.rpartition(".")
+        siblings = [sibling for sibling in STANDARDS_INDEX.lookup(cluster) if sibling in standards]
+        if not siblings:
+            continue
+        first = standards[siblings[0]]
+        item = entry(standard_id, first["grade"], first["strand"])
+        item["inferred_from"] = siblings
+        for sibling in siblings:
+            add(item["threads"], standards[sibling]["threads"])
+            add(item["prior"], standards[sibling]["prior"])
+            add(item["following"], standards[sibling]["following"])
+    return standards
+
+
+def progression_files(data_dir=DATA_DIR):
+    return sorted(path for path in Path(data_dir).glob("*.docx") if PROGRESSION_PATTERN.match(path.name))
+
+
+def index_path():
+    return cache_root() / "progressions" / f"index-v{PROGRESSION_FORMAT_VERSION}.json"
+
+
+def load_or_build_index(data_dir=DATA_DIR, force=False):
+    """Return the serialized index for data_dir, parsing the documents only when their digests changed."""
+    sources = {path.name: file_digest(path) for path in progression_files(data_dir)}
+    path = index_path()
+    if not force:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("sources") == sources:
+                return index
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+    documents = [parse_progression(file_path) for file_path in progression_files(data_dir)]
+    index = {
+        "version": PROGRESSION_FORMAT_VERSION,
+        "sources": sources,
+        "standards": build_index(documents),
+    }
+    write_atomic(path, json.dumps(index, indent=1).encode("utf-8"))
+    return index
+
+
+def _describe(standard_id, standards):
+    """One line for a related standard: its MATH_STANDARDS description, else the progression summary."""
+    standard = STANDARDS_INDEX.get(standard_id)
+    if standard:
+        return f"{standard_id}: {standard['description']}"
+    summary = standards.get(standard_id, {}).get("summary")
+    return f"{standard_id}: {summary}" if summary else standard_id
+
+
+class ProgressionIndex:
+    """Prior and following standards for each grade 6-8 standard named in the progressions."""
+
+    def __init__(self, index):
+        self.sources = index["sources"]
+        self.standards = index["standards"]
+
+    def get(self, standard_id):
+        """Return the entry for a standard ID, or None if no progression mentions it."""
+        return self.standards.get(standard_id.upper())
+
+    def prior(self, standard_id):
+        entry = self.get(standard_id)
+        return list(entry["prior"]) if entry else []
+
+    def following(self, standard_id):
+        entry = self.get(standard_id)
+        return list(entry["following"]) if entry else []
+
+    def context_for(self, standard_ids):
+        """Prerequisite context for the analysis prompt, or "" when no standard has an entry."""
+        blocks = []
+        for standard_id in standard_ids:
+            entry = self.get(standard_id)
+            if entry is None:
+                continue
+            lines = [f"{standard_id} ({'; '.join(entry['threads']) or entry['strand'] + ' strand'})"]
+            if entry["prior"]:
+                lines.append("  Builds on:")
+                lines += [f"    - {_describe(prior, self.standards)}" for prior in entry["prior"]]
+            if entry["following"]:
+                lines.append("  Leads to:")
+                lines += [f"    - {_describe(following, self.standards)}" for following in entry["following"]]
+            blocks.append("\n".join(lines))
+        if not blocks:
+            return ""
+        return f"{PREREQUISITE_CONTEXT_HEADER}\n" + "\n\n".join(blocks) + "\n"
+
+
+def data_signature(data_dir):
+    """Map of progression document name -> (mtime, size)."""
+    signature = {}
+    for path in progression_files(data_dir):
+        stat = path.stat()
+        signature[path.name] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+def get_progressions(data_dir=DATA_DIR):
+    """Return the process-wide ProgressionIndex, reloading only when the documents change."""
+    key = str(data_dir)
+    signature = data_signature(data_dir)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        progressions = ProgressionIndex(load_or_build_index(data_dir))
+        _indexes[key] = (signature, progressions)
+        return progressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the cached index of grade 6-8 standard progressions.")
+    parser.add_argument("standards", nargs="*", help="standard IDs to print prerequisite context for")
+    parser.add_argument("--data", default=str(DATA_DIR), help="directory of progression documents (default: data/)")
+    parser.add_argument("--force", action="store_true", help="re-parse the documents even if the index is current")
+    args = parser.parse_args(argv)
+
+    if not progression_files(args.data):
+        print(f"No progression documents found in {args.data}", file=sys.stderr)
+        return 1
+    index = load_or_build_index(args.data, force=args.force)
+    progressions = ProgressionIndex(index)
+    linked = sum(1 for entry in progressions.standards.values() if entry["prior"] or entry["following"])
+    known = sum(1 for standard_id in progressions.standards if STANDARDS_INDEX.get(standard_id))
+    print(f"{len(index['sources'])} documents -> {len(progressions.standards)} standards "
+          f"({linked} linked, {known} in MATH_STANDARDS); index at {os.path.relpath(index_path())}")
+    if args.standards:
+        print()
+        print(progressions.context_for([s.upper() for s in args.standards]) or "No progression entries.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# Indexed lookup of Florida math benchmarks from MATH_STANDARDS
+
+import re
+from functools import lru_cache
+
+from math_standards import MATH_STANDARDS
+
+# Full IDs ("MA.7.AR.2.1") and prefixes of them ("MA.7", "MA.7.AR", "MA.7.AR.2")
+STANDARD_REFERENCE_PATTERN = re.compile(r"\bMA(?:\.\d+(?:\.[A-Z]+(?:\.\d+){0,2})?)?\b", re.IGNORECASE)
+
+
+def format_standard_for_analysis(standard_id, standard):
+    """Format a complete standard with all details for analysis."""
+    formatted = f"{standard_id}: {standard['description']}\n"
+
+    if standard['clarifications']:
+        formatted += "Clarifications:\n"
+        for i, clarification in enumerate(standard['clarifications'], 1):
+            formatted += f"  {i}. {clarification}\n"
+
+    if standard['examples']:
+        formatted += "Examples:\n"
+        for i, example in enumerate(standard['examples'], 1):
+            formatted += f"  {i}. {example}\n"
+
+    return formatted + "\n"
+
+
+class StandardsIndex:
+    """Lookups by exact ID, ID prefix, grade and domain, built once."""
+
+    def __init__(self, standards):
+        self.standards = standards
+        self.by_prefix = {}
+        self.by_grade = {}
+        self.by_domain = {}
+        self.formatted = {}
+        for standard_id, standard in standards.items():
+            parts = standard_id.split(".")  # e.g. ["MA", "7", "AR", "2", "1"]
+            for length in range(2, len(parts) + 1):
+                self.by_prefix.setdefault(".".join(parts[:length]), []).append(standard_id)
+            self.by_grade.setdefault(int(parts[1]), []).append(standard_id)
+            self.by_domain.setdefault(parts[2], []).append(standard_id)
+            self.formatted[standard_id] = format_standard_for_analysis(standard_id, standard)
+
+    def get(self, standard_id):
+        """Return the MATH_STANDARDS entry for an exact ID, or None."""
+        return self.standards.get(standard_id.upper())
+
+    def lookup(self, reference):
+        """Return the IDs matching an exact ID or a prefix such as "MA.7.AR"."""
+        return list(self.by_prefix.get(reference.upper().rstrip("."), []))
+
+    def for_grade(self, grade):
+        return list(self.by_grade.get(int(grade), []))
+
+    def for_domain(self, domain):
+        return list(self.by_domain.get(domain.upper(), []))
+
+    def find_ids(self, text):
+        """Return the standard IDs referenced in free text, in order and without duplicates."""
+        found = {}
+        for match in STANDARD_REFERENCE_PATTERN.finditer(text):
+            for standard_id in self.lookup(match.group()):
+                found[standard_id] = None
+        return list(found)
+
+    def unresolved_references(self, text):
+        """Return references in free text ("MA.6.NSO.1.5") that match no standard, in order and without duplicates."""
+        found = {}
+        for match in STANDARD_REFERENCE_PATTERN.finditer(text):
+            reference = match.group().upper()
+            if "." in reference and not self.lookup(reference):
+                found[reference] = None
+        return list(found)
+
+    def resolve(self, standards_text):
+        """Expand IDs and prefixes typed in the standards input to full standard text.
+
+        Lines that reference known standards are replaced by the formatted
+        descriptions, clarifications and examples, followed by the line as
+        typed when it also references IDs the index cannot expand; other lines
+        are kept as typed. Returns (resolved text, resolved IDs).
+        """
+        return _resolve_cached(self, standards_text)
+
+
+@lru_cache(maxsize=256)
+def _resolve_cached(index, standards_text):
+    resolved_lines = []
+    resolved_ids = []
+    for line in standards_text.splitlines():
+        line_ids = index.find_ids(line)
+        if line_ids:
+            # IDs already expanded from an earlier line are not repeated
+            new_ids = [standard_id for standard_id in line_ids if standard_id not in resolved_ids]
+            resolved_ids.extend(new_ids)
+            resolved_lines.extend(index.formatted[standard_id] for standard_id in new_ids)
+            if index.unresolved_references(line):
+                # Keep the line so the references that could not be expanded still reach the model
+                resolved_lines.append(line + "\n")
+        elif line.strip():
+            resolved_lines.append(line + "\n")
+    return "".join(resolved_lines), tuple(resolved_ids)
+
+
+# Built once per process, when the module is first imported
+STANDARDS_INDEX = StandardsIndex(MATH_STANDARDS)
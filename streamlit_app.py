@@ -1,20 +1,45 @@
 import streamlit as st
 import pandas as pd
 import os
-from pathlib import Path
 from dotenv import load_dotenv
 import base64
-import google.generativeai as genai
-import PyPDF2
 import docx
 from io import BytesIO
-import re
+import time
+import asyncio
+import contextlib
 import streamlit.components.v1 as components
-import fitz  # PyMuPDF
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-# Load environment variables
+# Load environment variables before the local modules, some of which read settings on import
 load_dotenv()
 
+from analysis_cache import AnalysisCache
+from corpus_bundle import get_bundle
+from lesson_analysis import (
+    DEFAULT_INSTRUCTIONS, INSTRUCTIONS_PATH, AnalysisCancelled, AssembledLessons, MemoryCeilingExceeded,
+    assemble_lessons, build_map_prompt, build_reduce_prompt, estimate_tokens, fan_out, plan_analysis,
+    split_lessons,
+)
+import lesson_catalog
+from lesson_catalog import LESSONS_DIR
+from model_client import get_client
+from model_providers import provider_model_name, requires_api_key
+from lesson_boilerplate import get_boilerplate
+from lesson_relevance import get_relevance
+from lesson_extraction import clean_page, iter_lesson_pages, join_pages
+from page_retrieval import format_focused_pages, select_focused_pages, standard_query_text
+from page_thumbnails import page_count, render_thumbnail
+from pdf_optimizer import optimized_pdf
+from pdf_serving import publish_pdf
+from perf_trace import STAGES, AnalysisTrace, record_trace, trace_metrics
+from processed_pdfs import ensure_processed_pdf
+from standard_progressions import PREREQUISITE_CONTEXT_HEADER, get_progressions
+from standards_index import STANDARDS_INDEX
+
+analysis_cache = AnalysisCache()
+
 # Set the title and favicon that appear in the Browser's tab bar.
 st.set_page_config(
     page_title='Lesson Analysis',
@@ -32,39 +57,15 @@ def get_api_key():
         st.error("Google API key not found! Please make sure your .env file contains the GOOGLE_API_KEY")
     return api_key
 
-def extract_text_from_pdf(file_path):
-    """Extract text content from PDF file at given path."""
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {e}")
-        return None
-
-
 def load_instructions():
     """Load instructions from instructions.txt file."""
     try:
-        instructions_path = Path(__file__).parent / "instructions.txt"
-        if instructions_path.exists():
-            with open(instructions_path, "r", encoding="utf-8") as f:
+        if INSTRUCTIONS_PATH.exists():
+            with open(INSTRUCTIONS_PATH, "r", encoding="utf-8") as f:
                 return f.read()
         else:
             st.warning("instructions.txt not found. Using default instructions.")
-            return """
-            Please analyze the following combination of lessons based on the provided math standards.
-            
-            Provide a comprehensive analysis including:
-            1. How well the lessons addresses the specified standards
-            2. Alignment with the provided standard
-            3. Strengths of the lessons
-            4. Areas for improvement
-            5. Suggested modifications or extensions
-            """
+            return DEFAULT_INSTRUCTIONS
     except Exception as e:
         st.error(f"Error loading instructions: {e}")
         return None
@@ -76,63 +77,175 @@ def format_standard_for_display(standard_id):
 
 def format_standard_for_analysis(standard_id):
     """Format a complete standard with all details for analysis."""
-    standard = MATH_STANDARDS[standard_id]
-    formatted = f"{standard_id}: {standard['description']}\n"
-    
-    if standard['clarifications']:
-        formatted += "Clarifications:\n"
-        for i, clarification in enumerate(standard['clarifications'], 1):
-            formatted += f"  {i}. {clarification}\n"
-    
-    if standard['examples']:
-        formatted += "Examples:\n"
-        for i, example in enumerate(standard['examples'], 1):
-            formatted += f"  {i}. {example}\n"
-    
-    return formatted + "\n"
+    return STANDARDS_INDEX.formatted[standard_id]
 
-def analyze_lesson(standards, lesson_text):
-    """Send lesson information to Gemini API for analysis."""
-    api_key = get_api_key()
-    if not api_key:
-        return None
-    
-    # Initialize the Gemini API
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash-preview-05-20")
-    
+def show_queue_position(placeholder):
+    """on_wait callback that shows where a request stands in the rate-limit queue."""
+    def on_wait(position, seconds):
+        placeholder.info(f"⏳ Waiting for the model: position {position} in queue (about {seconds:.0f}s)")
+    return on_wait
+
+def generate_text(client, prompt, stream_to=None):
+    """Run one model request, optionally streaming markdown into a placeholder.
+
+    Returns (text, seconds_to_first_output).
+    """
+    start_time = time.perf_counter()
+    status = stream_to if stream_to is not None else st.empty()
+    if stream_to is None:
+        text = client.generate_text(prompt, on_wait=show_queue_position(status))
+        status.empty()
+        return text, time.perf_counter() - start_time
+
+    first_output_seconds = None
+
+    def show_chunk(text):
+        nonlocal first_output_seconds
+        if first_output_seconds is None:
+            first_output_seconds = time.perf_counter() - start_time
+        stream_to.markdown(text + "▌")
+
+    text = client.generate_text(prompt, on_chunk=show_chunk, on_wait=show_queue_position(status))
+    return text, first_output_seconds
+
+def session_is_active():
+    """False once the browser session running this script has gone away."""
+    ctx = get_script_run_ctx()
+    if ctx is None or not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(ctx.session_id)
+
+def run_map_step(client, standards, pieces, progress):
+    """Analyze (label, text) pieces concurrently, showing each finding as it arrives.
+
+    Returns the (label, findings) results and the map prompts' (characters, estimated tokens).
+    """
+    finished = 0
+    prompt_sizes = []
+
+    def show_result(index, partial):
+        nonlocal finished
+        finished += 1
+        progress.update(label=f"Analyzed {finished} of {len(pieces)} lesson parts")
+        with progress:
+            st.markdown(f"**{pieces[index][0]}**\n\n{partial}")
+
+    def show_waiting(position, seconds):
+        progress.update(
+            label=f"Analyzed {finished} of {len(pieces)} lesson parts; waiting for the model (position {position} in queue)"
+        )
+
+    def map_request(piece):
+        prompt = build_map_prompt(standards, *piece)
+        prompt_sizes.append((len(prompt), estimate_tokens(prompt)))
+        return client.generate_text_async(prompt, on_wait=show_waiting)
+
+    partials = asyncio.run(fan_out(
+        map_request,
+        pieces,
+        on_result=show_result,
+        should_continue=session_is_active,
+    ))
+    return [(label, partial) for (label, _), partial in zip(pieces, partials)], prompt_sizes
+
+def analyze_lesson(standards, lessons, force_refresh=False, stream_to=None, trace=None, lesson_hashes=None):
+    """Send lesson information to Gemini API for analysis.
+
+    lessons is a list of (name, text) pairs in selection order. When the
+    combined prompt is too large, each lesson (or part of one) is analyzed
+    separately and the findings are merged in a final reduce request.
+
+    Returns (analysis, cached_at). cached_at is the time the analysis was first
+    generated when it was served from the analysis cache, otherwise None.
+    When stream_to is a Streamlit placeholder, the response is streamed and the
+    markdown rendered into it as chunks arrive. Prompt building and the model
+    call are timed into trace, when given. lesson_hashes, when given, are the
+    content hashes of the lesson texts (as computed by assemble_lessons).
+    """
+    trace = trace or AnalysisTrace()
     # Load instructions from file
     instructions = load_instructions()
     if not instructions:
-        return None
+        return None, None
+
+    model_name = provider_model_name()
+    with trace.span("prompt_build"):
+        prompt, mode, cache_key = plan_analysis(instructions, standards, lessons, model_name, lesson_hashes)
+    trace.set(mode=mode, model=model_name)
+    if not force_refresh:
+        cached = analysis_cache.get(cache_key)
+        if cached:
+            trace.set(cache="hit")
+            return cached["analysis"], cached["created_at"]
+    trace.set(cache="bypass" if force_refresh else "miss")
+
+    api_key = None
+    if requires_api_key():
+        api_key = get_api_key()
+        if not api_key:
+            return None, None
+    
+    # Shared, rate-limited client for LLM_PROVIDER (created once per process)
+    client = get_client(api_key)
     
-    # Get list of selected standard IDs
+    # Get list of selected standard IDs (not the related standards in the prerequisite context)
     selected_standards = []
-    for line in standards.split('\n'):
+    for line in standards.partition(PREREQUISITE_CONTEXT_HEADER)[0].split('\n'):
         if line and ':' in line:
             standard_id = line.split(':')[0].strip()
             selected_standards.append(standard_id)
 
-    
-    prompt = f"""
-    {instructions}
-    
-    MATH STANDARDS:
-    {standards}
-    
-    
-    LESSON:
-    {lesson_text}... (truncated for brevity)
-    """
-    
     # Use the simplified API call with proper generation config
-    try:
-        generation_config = genai.GenerationConfig(max_output_tokens=8192)
-        response = model.generate_content(prompt, generation_config=generation_config)
-        return response.text
-    except Exception as e:
-        st.error(f"API Error: {str(e)}")
-        return None
+    with trace.span("model_call"):
+        try:
+            start_time = time.perf_counter()
+            map_requests = 0
+            if mode == "single":
+                prompt_sizes = [(len(prompt), estimate_tokens(prompt))]
+                analysis, first_output_seconds = generate_text(client, prompt, stream_to)
+            else:
+                # Map: collect evidence from each lesson (or part of one) concurrently
+                pieces = split_lessons(lessons)
+                progress = st.status(
+                    f"Prompt is about {estimate_tokens(prompt):,} tokens; analyzing {len(pieces)} lesson parts separately..."
+                )
+                partial_results, prompt_sizes = run_map_step(client, standards, pieces, progress)
+                progress.update(state="complete", expanded=False)
+                map_requests = len(pieces)
+                # Reduce: merge the findings into the coverage template
+                reduce_start = time.perf_counter()
+                reduce_prompt = build_reduce_prompt(instructions, standards, partial_results)
+                prompt_sizes.append((len(reduce_prompt), estimate_tokens(reduce_prompt)))
+                analysis, first_output_seconds = generate_text(client, reduce_prompt, stream_to)
+                if first_output_seconds is not None:
+                    first_output_seconds += reduce_start - start_time
+            total_seconds = time.perf_counter() - start_time
+        except AnalysisCancelled:
+            return None, None
+        except Exception as e:
+            st.error(f"API Error: {str(e)}")
+            return None, None
+
+    # Keep per-run timings for this session
+    st.session_state.setdefault("analysis_timings", []).append({
+        "streamed": stream_to is not None,
+        "mode": mode,
+        "map_requests": map_requests,
+        "time_to_first_token": first_output_seconds,
+        "total_time": total_seconds,
+    })
+    # What was actually sent: the single prompt, or every map prompt and the reduce prompt
+    trace.set(
+        prompt_chars=sum(chars for chars, _ in prompt_sizes),
+        prompt_tokens=sum(tokens for _, tokens in prompt_sizes),
+        map_requests=map_requests,
+        time_to_first_token=first_output_seconds,
+        output_tokens=estimate_tokens(analysis) if analysis else 0,
+    )
+
+    if analysis:
+        analysis_cache.put(cache_key, analysis, model=model_name, mode=mode, standards=selected_standards)
+    return analysis, None
 
 def display_pdf(file_path):
     """Display the PDF from the given file path with better error handling."""
@@ -142,14 +255,19 @@ def display_pdf(file_path):
         if not processed_path:
             return
 
-        # Read the reprocessed PDF file and encode it in base64
-        with open(processed_path, "rb") as f:
-            base64_pdf = base64.b64encode(f.read()).decode('utf-8')
+        if st.get_option("server.enableStaticServing"):
+            # Let the browser fetch the PDF by URL (supports byte-range requests)
+            pdf_src = publish_pdf(processed_path)
+        else:
+            # Read the reprocessed PDF file and encode it in base64
+            with open(processed_path, "rb") as f:
+                base64_pdf = base64.b64encode(f.read()).decode('utf-8')
+            pdf_src = f"data:application/pdf;base64,{base64_pdf}"
 
         # Embed the PDF in an iframe
         pdf_display = f"""
             <iframe
-                src="data:application/pdf;base64,{base64_pdf}"
+                src="{pdf_src}"
                 width="100%"
                 height="600px"
                 frameborder="0"
@@ -159,62 +277,87 @@ def display_pdf(file_path):
     except Exception as e:
         st.error(f"Error displaying PDF: {e}")
 
-def get_lessons_by_grade_and_unit():
-    """Scan the lessons directory and organize PDFs by grade and unit."""
-    lessons_dir = Path(__file__).parent / "lessons"
-    if not lessons_dir.exists():
-        st.error(f"Lessons directory not found at {lessons_dir}")
-        return {}
-    
-    # Dictionary to store lessons by grade and unit
-    lessons_by_grade_and_unit = {}
-    
-    # Regular expression to match lesson file patterns like "6.02.06.pdf"
-    pattern = re.compile(r"(\d+)\.(\d+)\.(\d+)\.pdf")
-    
-    # Scan directory for PDF files
-    for file_path in lessons_dir.glob("*.pdf"):
-        file_name = file_path.name
-        match = pattern.match(file_name)
-        
-        if match:
-            grade, unit, lesson = match.groups()
-            grade_key = f"Grade {int(grade)}"  # Convert "6" to "Grade 6"
-            unit_key = f"Unit {int(unit)}"    # Convert "02" to "Unit 2"
-            lesson_number = int(lesson)      # Convert "06" to 6
-            
-            # Create simplified lesson name for display
-            lesson_name = f"Lesson {lesson_number}"
-            
-            # Add to dictionary
-            if grade_key not in lessons_by_grade_and_unit:
-                lessons_by_grade_and_unit[grade_key] = {}
-            if unit_key not in lessons_by_grade_and_unit[grade_key]:
-                lessons_by_grade_and_unit[grade_key][unit_key] = []
-            
-            lessons_by_grade_and_unit[grade_key][unit_key].append({
-                "name": lesson_name,
-                "path": str(file_path),
-                "number": lesson_number,    # Store lesson number for sorting
-                "full_name": file_name      # Keep original filename for reference
+@st.fragment
+def display_thumbnails(file_path, pages_shown=6, columns=3):
+    """Show low-DPI page previews, rendering only the pages currently requested."""
+    try:
+        total_pages = page_count(file_path)
+        first_page = 1
+        if total_pages > pages_shown:
+            # Paging reruns only this fragment, not the whole analysis
+            first_page = st.number_input(
+                f"First page (of {total_pages})", min_value=1, max_value=total_pages,
+                value=1, step=pages_shown, key=f"thumbnail_start_{file_path}"
+            )
+        page_columns = st.columns(columns)
+        for i, page_number in enumerate(range(first_page - 1, min(first_page - 1 + pages_shown, total_pages))):
+            page_columns[i % columns].image(render_thumbnail(file_path, page_number), caption=f"Page {page_number + 1}")
+    except Exception as e:
+        st.error(f"Error rendering page previews: {e}")
+
+def get_lesson_catalog():
+    """Return the indexed lesson catalog (built once per change to lessons/)."""
+    if not LESSONS_DIR.exists():
+        st.error(f"Lessons directory not found at {LESSONS_DIR}")
+        return lesson_catalog.LessonCatalog({})
+    return lesson_catalog.get_lesson_catalog(LESSONS_DIR)
+
+def add_lessons_to_selection(records):
+    """Add lesson records to the multiselect, keeping existing picks (on_click callback)."""
+    selected = list(st.session_state.get("selected_lessons", []))
+    selected += [record.display_name for record in records if record.display_name not in selected]
+    st.session_state["selected_lessons"] = selected
+
+def show_performance(trace):
+    """Stage timings and prompt statistics of one run, next to this process's p50/p95."""
+    with st.expander("Performance"):
+        percentiles = trace_metrics.stage_percentiles()
+        rows = []
+        for stage, label in STAGES.items():
+            if stage not in trace.spans:
+                continue
+            p50, p95, samples = percentiles.get(stage, (None, None, 0))
+            rows.append({
+                "Stage": label,
+                "This run (s)": round(trace.spans[stage], 3),
+                "p50 (s)": round(p50, 3) if p50 is not None else None,
+                "p95 (s)": round(p95, 3) if p95 is not None else None,
+                "Runs": samples,
             })
-    
-    # Sort grades, units, and lessons by numerical order
-    return {
-        grade: {
-            unit: sorted(lessons, key=lambda x: x["number"])
-            for unit, lessons in sorted(units.items())
-        }
-        for grade, units in sorted(lessons_by_grade_and_unit.items())
-    }
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        attributes = trace.attributes
+        details = [f"Analysis cache: {attributes['cache']}"] if "cache" in attributes else []
+        if attributes.get("map_requests"):
+            details.append(
+                f"Prompts: {attributes['prompt_chars']:,} characters (~{attributes['prompt_tokens']:,} tokens) "
+                f"over {attributes['map_requests'] + 1} requests"
+            )
+        elif "prompt_chars" in attributes:
+            details.append(f"Prompt: {attributes['prompt_chars']:,} characters (~{attributes['prompt_tokens']:,} tokens)")
+        if "boilerplate_tokens_saved" in attributes:
+            details.append(f"Boilerplate stripped: ~{attributes['boilerplate_tokens_saved']:,} tokens")
+        if attributes.get("output_tokens"):
+            details.append(f"Output: ~{attributes['output_tokens']:,} tokens")
+        if attributes.get("time_to_first_token") is not None:
+            details.append(f"First output after {attributes['time_to_first_token']:.2f} s")
+        st.caption(" · ".join(details))
+
 def reprocess_pdf(file_path):
     """Reprocess the PDF to ensure compatibility."""
     try:
-        doc = fitz.open(file_path)
-        output_path = file_path.replace(".pdf", "_processed.pdf")
-        doc.save(output_path)
-        doc.close()
-        return output_path
+        # Prefer the smaller copy written by pdf_optimizer.py
+        optimized_path = optimized_pdf(file_path)
+        if optimized_path:
+            return optimized_path
+
+        # Then the copy pre-built by corpus_bundle.py when there is one
+        bundle = get_bundle()
+        bundled_path = bundle.processed_pdf(file_path) if bundle else None
+        if bundled_path:
+            return bundled_path
+
+        # Otherwise use (or create once) the copy in the processed-PDF cache
+        return str(ensure_processed_pdf(file_path))
     except Exception as e:
         st.error(f"Error reprocessing PDF: {e}")
         return None
@@ -228,86 +371,209 @@ This tool analyzes math lessons based on standards.
 Select a lesson and standards to get detailed feedback.
 """)
 
+# Memory-map the pre-built corpus bundle (if any) once, at startup
+get_bundle()
+
+# Load the grade 6-8 progression index (parsed from data/*.docx only when they change)
+progressions = get_progressions()
+
 # Get lessons organized by grade and unit
-lessons_by_grade_and_unit = get_lessons_by_grade_and_unit()
+catalog = get_lesson_catalog()
 
 # Sidebar for inputs
 with st.sidebar:
     st.header("Lesson Selection")
     
-    # Flatten the lessons structure for multi-selection
-    all_lessons = []
-    for grade, units in lessons_by_grade_and_unit.items():
-        for unit, lessons in units.items():
-            for lesson in lessons:
-                all_lessons.append({
-                    "grade": grade,
-                    "unit": unit,
-                    "name": lesson["name"],
-                    "path": lesson["path"],
-                    "full_name": lesson["full_name"]
-                })
-    
-    # Create a display name for each lesson
-    lesson_options = [
-        f"{lesson['grade']} - {lesson['unit']} - {lesson['name']} ({lesson['full_name']})"
-        for lesson in all_lessons
-    ]
+    # Bulk selection of a whole unit or grade
+    if catalog.records:
+        grade_column, unit_column = st.columns(2)
+        bulk_grade = grade_column.selectbox("Grade", catalog.grades())
+        bulk_unit = unit_column.selectbox("Unit", catalog.units(bulk_grade))
+        unit_button_column, grade_button_column = st.columns(2)
+        unit_button_column.button(
+            "Add unit", use_container_width=True, on_click=add_lessons_to_selection,
+            args=(catalog.lessons_in_unit(bulk_grade, bulk_unit),)
+        )
+        grade_button_column.button(
+            "Add grade", use_container_width=True, on_click=add_lessons_to_selection,
+            args=(catalog.lessons_in_grade(bulk_grade),)
+        )
     
     # Multi-selection for lessons
-    selected_lesson_display_names = st.multiselect("Select Lessons", lesson_options)
+    selected_lesson_display_names = st.multiselect("Select Lessons", catalog.display_names, key="selected_lessons")
     
-    # Get the paths of the selected lessons
-    selected_lesson_paths = [
-        lesson["path"] for lesson in all_lessons
-        if f"{lesson['grade']} - {lesson['unit']} - {lesson['name']} ({lesson['full_name']})" in selected_lesson_display_names
-    ]
+    # Get the selected lessons (in grade, unit, lesson order)
+    selected_lessons = catalog.resolve_display_names(selected_lesson_display_names)
+    selected_lesson_paths = [lesson.path for lesson in selected_lessons]
     
     st.header("Standards Input")
     
     # Replace the dropdown with a text area for user input
     user_provided_standards = st.text_area(
         "Enter math standards for analysis (one standard per line):",
-        placeholder="Example:\n1. Standard ID: Description\n2. Standard ID: Description"
+        placeholder="Example:\nMA.6.NSO.1.1\nMA.7.AR (every Grade 7 AR benchmark)\nStandard ID: Description"
     )
     
+    # Expand standard IDs and prefixes (e.g. "MA.7.AR") to their full text
+    resolved_standards, resolved_standard_ids = STANDARDS_INDEX.resolve(user_provided_standards)
+    if resolved_standard_ids:
+        st.caption(f"Recognized standards: {', '.join(resolved_standard_ids)}")
+    unresolved_references = STANDARDS_INDEX.unresolved_references(user_provided_standards)
+    if unresolved_references:
+        st.warning(f"Not in the standards list, sent as typed: {', '.join(unresolved_references)}")
+    
+    # Lessons that best match the recognized standards, from the precomputed relevance matrix
+    relevance = get_relevance() if resolved_standard_ids else None
+    if relevance is not None:
+        suggested_lessons = [
+            (catalog.by_path[path], score)
+            for path, score in (
+                (str(LESSONS_DIR / name), score) for name, score in relevance.suggest(resolved_standard_ids)
+            )
+            if path in catalog.by_path
+        ]
+        if suggested_lessons:
+            st.markdown("**Suggested lessons**")
+            st.markdown("\n".join(
+                f"- {record.display_name} · {score:.2f}" for record, score in suggested_lessons
+            ))
+            st.button(
+                "Add suggested lessons", use_container_width=True, on_click=add_lessons_to_selection,
+                args=([record for record, _ in suggested_lessons],)
+            )
+        if relevance.stale_lessons:
+            st.caption(
+                f"{relevance.stale_lessons} lessons changed since suggestions were computed; "
+                "run `python lesson_relevance.py` to update them."
+            )
+    
     # Add some space before the generate button
     st.markdown("---")
     
     # Generate Analysis button
     generate_analysis = st.button("Generate Analysis", type="primary", use_container_width=True)
+    pdf_display_mode = st.radio(
+        "Lesson PDF display",
+        ["Full viewer", "Page thumbnails"],
+        help="Page thumbnails render small previews of a few pages at a time instead of loading the whole PDF."
+    )
+    prerequisite_context = st.checkbox(
+        "Prerequisite context",
+        value=True,
+        help="Tell the model which standards come before and after the selected ones in the grade 6-8 progressions."
+    )
+    strip_boilerplate = st.checkbox(
+        "Strip boilerplate",
+        value=True,
+        help="Leave out lines repeated across many lessons (page furniture, recurring directions) "
+             "found by lesson_boilerplate.py."
+    )
+    focused_mode = st.checkbox(
+        "Focused mode",
+        help="Send only the lesson pages most relevant to the standards instead of every page."
+    )
+    stream_results = st.checkbox(
+        "Stream results",
+        value=True,
+        help="Show the analysis as it is generated instead of waiting for the full response."
+    )
+    force_refresh = st.checkbox(
+        "Force refresh",
+        help="Ignore any cached analysis for these lessons and standards and call the model again."
+    )
 
 # Main content area - only run when "Generate Analysis" is clicked
 if generate_analysis:
     if selected_lesson_paths:
-        # Combine text from all selected lessons
-        combined_lesson_text = ""
-        for lesson_path in selected_lesson_paths:
-            lesson_text = extract_text_from_pdf(lesson_path)
-            if lesson_text:
-                combined_lesson_text += lesson_text + "\n\n"  # Add spacing between lessons
-            else:
-                st.error(f"Could not extract text from the PDF: {lesson_path}")
+        # Time each stage of this run for the Performance panel and metrics export
+        trace = AnalysisTrace()
+        trace.set(lessons=len(selected_lesson_paths), focused=bool(focused_mode), streamed=bool(stream_results))
+
+        # Read the selected lessons one at a time (upcoming cache misses parse in parallel)
+        # and pass their pages through cleaning into per-lesson texts
+        extraction_errors = []
+        # Lines repeated across the corpus are dropped before the pages are assembled
+        boilerplate = get_boilerplate() if strip_boilerplate else None
+        stripper = boilerplate.stripper() if boilerplate else None
+        keep_pages = bool(focused_mode and user_provided_standards.strip())
+        # Closing the stream cancels the parses queued ahead when assembly stops early
+        with contextlib.closing(iter_lesson_pages(
+            selected_lesson_paths, on_error=lambda path, error: extraction_errors.append((path, error))
+        )) as page_stream:
+            page_records = stripper.strip(page_stream) if stripper else page_stream
+            try:
+                with trace.span("extraction"):
+                    assembled = assemble_lessons(page_records, clean=clean_page, keep_pages=keep_pages)
+            except MemoryCeilingExceeded as e:
+                st.error(str(e))
+                # Nothing to analyze; the selection as a whole has been reported
+                assembled = AssembledLessons(selected_lesson_paths, [], [] if keep_pages else None, [], 0, 0)
+        for path, error in extraction_errors:
+            st.error(f"Error reading PDF {os.path.basename(path)}: {error}")
+        reported_paths = set(assembled.paths) | {path for path, _ in extraction_errors}
+        for path in selected_lesson_paths:
+            if path not in reported_paths:
+                st.error(f"Could not extract text from the PDF: {path}")
+        trace.set(pages=assembled.page_count, lesson_text_chars=assembled.text_chars)
+        if stripper:
+            trace.set(boilerplate_lines=stripper.removed_lines, boilerplate_tokens_saved=stripper.tokens_saved)
 
         # Display the combined lesson information
         st.subheader("Selected Lessons")
         for lesson_path in selected_lesson_paths:
-            selected_lesson = next(
-                (lesson for lesson in all_lessons if lesson["path"] == lesson_path),
-                None
-            )
-            lesson_display_name = f"{selected_lesson['grade']} - {selected_lesson['unit']} - {selected_lesson['name']} ({selected_lesson['full_name']})" if selected_lesson else f"Lesson: {os.path.basename(lesson_path)}"
+            selected_lesson = catalog.by_path.get(lesson_path)
+            lesson_display_name = selected_lesson.display_name if selected_lesson else f"Lesson: {os.path.basename(lesson_path)}"
             st.markdown(f"- {lesson_display_name}")
+        if stripper and stripper.removed_lines:
+            st.caption(
+                f"Stripped {stripper.removed_lines:,} boilerplate lines (~{stripper.tokens_saved:,} tokens saved)."
+            )
 
         # Analyze the combined lesson text
         st.subheader("Analysis Results")
-        if user_provided_standards.strip() and combined_lesson_text.strip():
+        lesson_hashes = None
+        if keep_pages:
+            # Keep only the pages that best match the standards, within the token budget
+            with trace.span("prompt_build"):
+                focused_pages = select_focused_pages(assembled.pages, standard_query_text(resolved_standards))
+                if focused_pages is None:
+                    lesson_texts = [(name, join_pages(pages)) for name, pages in assembled.pages]
+                else:
+                    lesson_texts = [(name, format_focused_pages(pages)) for name, pages in focused_pages]
+            if focused_pages is None:
+                st.caption("Focused mode: no page matched the standards, so the full lessons are sent.")
+            else:
+                st.caption(
+                    f"Focused mode: sending {sum(len(pages) for _, pages in focused_pages)} of "
+                    f"{assembled.page_count} pages."
+                )
+        else:
+            lesson_texts, lesson_hashes = assembled.lessons, assembled.hashes
+        if user_provided_standards.strip() and any(text.strip() for _, text in lesson_texts):
             with st.spinner("Analyzing combined lessons... This may take a moment."):
-                analysis = analyze_lesson(user_provided_standards, combined_lesson_text)
-                if analysis:
-                    st.markdown(analysis)
+                analysis_placeholder = st.empty()
+                analysis_standards = resolved_standards
+                if prerequisite_context:
+                    analysis_standards += progressions.context_for(resolved_standard_ids)
+                analysis, cached_at = analyze_lesson(
+                    analysis_standards, lesson_texts, force_refresh,
+                    stream_to=analysis_placeholder if stream_results else None, trace=trace,
+                    lesson_hashes=lesson_hashes,
+                )
+            if analysis:
+                analysis_placeholder.markdown(analysis)
+                if cached_at:
+                    generated = pd.Timestamp(cached_at, unit="s", tz="UTC").strftime("%Y-%m-%d %H:%M UTC")
+                    st.caption(f"⚡ Served from cache (generated {generated}). Tick \"Force refresh\" to re-run the analysis.")
                 else:
-                    st.error("Analysis failed. Please check your API key and inputs.")
+                    timing = st.session_state["analysis_timings"][-1]
+                    first_token = timing["time_to_first_token"]
+                    st.caption(
+                        f"First output after {first_token:.1f} s · finished in {timing['total_time']:.1f} s"
+                        if first_token is not None else f"Finished in {timing['total_time']:.1f} s"
+                    )
+            else:
+                st.error("Analysis failed. Please check your API key and inputs.")
         else:
             if not user_provided_standards.strip():
                 st.error("Please input at least one math standard.")
@@ -318,10 +584,17 @@ if generate_analysis:
         if selected_lesson_paths:
             st.subheader("Selected Lesson PDFs")
             tabs = st.tabs([os.path.basename(path) for path in selected_lesson_paths])
-            for tab, lesson_path in zip(tabs, selected_lesson_paths):
-                with tab:
-                    st.markdown(f"### {os.path.basename(lesson_path)}")
-                    display_pdf(lesson_path)
+            with trace.span("pdf_embed"):
+                for tab, lesson_path in zip(tabs, selected_lesson_paths):
+                    with tab:
+                        st.markdown(f"### {os.path.basename(lesson_path)}")
+                        if pdf_display_mode == "Page thumbnails":
+                            display_thumbnails(lesson_path)
+                        else:
+                            display_pdf(lesson_path)
+
+        record_trace(trace)
+        show_performance(trace)
     else:
         st.info("Please select at least one lesson to begin analysis.")
 
@@ -0,0 +1,50 @@
+# Regression check: back-to-back map-reduce analyses in one process through the Gemini provider
+
+import asyncio
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import google.generativeai as genai
+
+import model_providers
+from lesson_analysis import AnalysisPlan, analyze_async
+from model_client import ModelClient
+
+
+class LoopBoundModel:
+    """Stands in for genai.GenerativeModel: like genai's grpc.aio client, the async
+    path only works on the event loop it first ran on."""
+
+    def __init__(self, model_name):
+        self.loop = None
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        return types.SimpleNamespace(text=f"findings {self.calls}")
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif self.loop is not loop:
+            raise RuntimeError("Event loop is closed")
+        return self.generate_content(prompt)
+
+
+def test_two_map_reduce_analyses_back_to_back(monkeypatch):
+    monkeypatch.setattr(genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(genai, "GenerativeModel", LoopBoundModel)
+    client = ModelClient(model_providers.GeminiProvider("test-key"), requests_per_minute=600,
+                         tokens_per_minute=10_000_000, max_retries=0)
+    lessons = [("6.01.01.pdf", "ratios " * 50), ("6.01.02.pdf", "rates " * 50)]
+    plan = AnalysisPlan(prompt="", mode="map_reduce", cache_key="")
+
+    # Each analysis runs in its own asyncio.run(), as the app and batch runner do
+    for _ in range(2):
+        analysis = asyncio.run(analyze_async(client, "Analyze.", "MA.6.AR.1.1: x", lessons, plan))
+        assert analysis.startswith("findings")
+    assert client.provider.model.calls == 6  # Two map requests and a reduce, twice
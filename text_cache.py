@@ -0,0 +1,138 @@
+# On-disk, content-addressed cache for text extracted from lesson PDFs
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+DEFAULT_TEXT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_root():
+    """Return the root directory for on-disk caches (LESSON_CACHE_DIR in .env overrides it)."""
+    return Path(os.environ.get("LESSON_CACHE_DIR", Path(__file__).parent / ".cache"))
+
+
+def write_atomic(path, data):
+    """Write bytes to path via a temporary file so readers never see a partial file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def evict_lru(paths, max_bytes):
+    """Delete the least recently used (oldest mtime) files until the rest fit in max_bytes."""
+    entries = []
+    total = 0
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total += stat.st_size
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+# Digests of files already hashed in this process, keyed by (path, mtime, size)
+_digest_memo = {}
+
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of a file's contents.
+
+    The digest is memoized per (path, mtime, size), so repeated lookups of an
+    unchanged lesson do not re-read its bytes.
+    """
+    stat = os.stat(file_path)
+    memo_key = (str(file_path), stat.st_mtime_ns, stat.st_size)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def forget_file(file_path):
+    """Drop memoized digests for a file and return them (e.g. after it changed on disk)."""
+    stale = [key for key in _digest_memo if key[0] == str(file_path)]
+    return {_digest_memo.pop(key) for key in stale}
+
+
+class TextCache:
+    """Extracted text stored on disk by content digest and extractor version.
+
+    Entries are plain UTF-8 files. Each hit refreshes the entry's mtime, and
+    when the total size goes over max_bytes the least recently used entries
+    are removed first.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        if root is None:
+            root = cache_root() / "text"
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("LESSON_TEXT_CACHE_MAX_BYTES", DEFAULT_TEXT_CACHE_MAX_BYTES))
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, digest, version):
+        # Entries start with the content digest so purge() can find every version
+        version_key = hashlib.sha256(version.encode("utf-8")).hexdigest()[:16]
+        return self.root / digest[:2] / f"{digest}-{version_key}.txt"
+
+    def get(self, digest, version):
+        """Return the cached text, or None on a miss."""
+        path = self._entry_path(digest, version)
+        try:
+            text = path.read_text(encoding="utf-8")
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return text
+
+    def contains(self, digest, version):
+        """True if text is cached for the digest/version pair (without reading it)."""
+        return self._entry_path(digest, version).exists()
+
+    def put(self, digest, version, text):
+        """Store text for a digest/version pair and enforce the size cap."""
+        write_atomic(self._entry_path(digest, version), text.encode("utf-8"))
+        self._evict()
+
+    def purge(self, digest):
+        """Delete every cached version of the text for a content digest."""
+        for path in self.root.glob(f"{digest[:2]}/{digest}-*.txt"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        evict_lru(self.root.glob("*/*.txt"), self.max_bytes)